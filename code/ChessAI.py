@@ -1,13 +1,27 @@
 import random
+import time
 from ChessEngine import GameState
+from ChessMate import MateSolver
 
 pieceValues = {"k": 0, "p": 1, "q": 9, "r": 5, "b": 3, "n": 3}
 CHECKMATE = 1000
 STALEMATE = -10
 DEPTH = 2
+MATE_THRESHOLD = CHECKMATE - 100
+
+# all randomness in this module comes from rng, so seed() makes play reproducible
+rng = random.Random()
+
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+def seed(value):
+    rng.seed(value)
+
 
 def findRandomMove(validMoves: list):
-    return validMoves[random.randint(0, len(validMoves)-1)]
+    return validMoves[rng.randint(0, len(validMoves)-1)]
 
 
 def findGreedyBestMove(gs: GameState, validMoves):
@@ -34,7 +48,7 @@ def findMinMaxDepth2Move(gs: GameState, valid_moves):
     turn = 1 if gs.white_to_move else -1
     opponenet_minmax_score = CHECKMATE+1
     best_move = None
-    random.shuffle(valid_moves)
+    rng.shuffle(valid_moves)
     for m in valid_moves:
         gs.make_move(m)
         oppponent_moves = gs.get_valid_moves()
@@ -69,7 +83,7 @@ def findBestMoveMinMax(gs:GameState, validMoves):
 
 def findMinMaxMove(gs:GameState, validMoves, depth, whiteToMove):
     global nextMove
-    random.shuffle(validMoves)
+    rng.shuffle(validMoves)
     if depth == 0:
         return scoreBoard(gs)
     
@@ -138,4 +152,418 @@ def scoreBoard(gs:GameState):
             elif c[0] == 'b': 
                 score -= pieceValues[c[1]]
 
-    return score
\ No newline at end of file
+    return score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TranspositionTable():
+    # fixed capacity, indexed by the low bits of the position hash;
+    # a new entry always overwrites whatever was in its slot
+    def __init__(self, size=1 << 16) -> None:
+        if size & (size - 1):
+            raise ValueError("size must be a power of two")
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.entries = [None] * size
+
+    def get(self, key):
+        i = key & self.mask
+        if self.keys[i] == key:
+            return self.entries[i]
+        return None
+
+    def put(self, key, depth, score, flag, move_id):
+        i = key & self.mask
+        self.keys[i] = key
+        self.entries[i] = (depth, score, flag, move_id)
+
+    def clear(self):
+        self.keys = [None] * len(self.keys)
+        self.entries = [None] * len(self.entries)
+
+
+class SearchResult():
+    # score is from the side to move's point of view
+    def __init__(self, move, score, depth, pv, nodes, elapsed) -> None:
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+
+def scoreToTT(score, ply):
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def scoreFromTT(score, ply):
+    if score > MATE_THRESHOLD:
+        return score - ply
+    if score < -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def orderMoves(moves, ttMoveId=None):
+    # TT move first, then captures by most valuable victim / least valuable attacker
+    def key(m):
+        if m.move_id == ttMoveId:
+            return -100
+        if m.piece_captured != '--':
+            return -10*pieceValues[m.piece_captured[1]] + pieceValues[m.piece_moved[1]]
+        return 0
+    moves.sort(key=key)
+    return moves
+
+
+class Searcher():
+    '''
+    Iterative deepening negamax with alpha-beta pruning and a transposition
+    table that is kept between searches.
+    '''
+
+    def __init__(self, tt: TranspositionTable = None, evaluate=None, exactDepth=False) -> None:
+        self.tt = tt if tt is not None else TranspositionTable()
+        # any function with the scoreBoard signature, e.g. NNUEEvaluator.scoreBoard
+        self.evaluate = evaluate if evaluate is not None else scoreBoard
+        # with exactDepth, table scores only cut off at the depth they were
+        # searched to, so a table shared between positions changes move
+        # ordering but never the horizon a score is computed at
+        self.exactDepth = exactDepth
+        self.nodes = 0
+        self.deadline = None
+
+    def checkTime(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def negaMax(self, gs: GameState, validMoves, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.checkTime()
+
+        turn = 1 if gs.white_to_move else -1
+        if len(validMoves) == 0:
+            if gs.checkmate:
+                return -CHECKMATE + ply
+            return turn*self.evaluate(gs)
+        if depth == 0:
+            return turn*self.evaluate(gs)
+
+        alphaOrig = alpha
+        entry = self.tt.get(gs.hash)
+        ttMoveId = None
+        if entry is not None:
+            ttDepth, ttScore, ttFlag, ttMoveId = entry
+            if ttDepth == depth or (ttDepth > depth and not self.exactDepth):
+                ttScore = scoreFromTT(ttScore, ply)
+                if ttFlag == TT_EXACT:
+                    return ttScore
+                if ttFlag == TT_LOWER and ttScore >= beta:
+                    return ttScore
+                if ttFlag == TT_UPPER and ttScore <= alpha:
+                    return ttScore
+
+        maxScore = -CHECKMATE-1
+        bestMoveId = None
+        for move in orderMoves(validMoves, ttMoveId):
+            gs.make_move(move)
+            nextMoves = gs.get_valid_moves()
+            score = -self.negaMax(gs, nextMoves, depth-1, -beta, -alpha, ply+1)
+            gs.undo_move()
+            if score > maxScore:
+                maxScore = score
+                bestMoveId = move.move_id
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break
+
+        if maxScore <= alphaOrig:
+            flag = TT_UPPER
+        elif maxScore >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        self.tt.put(gs.hash, depth, scoreToTT(maxScore, ply), flag, bestMoveId)
+        return maxScore
+
+    def searchRoot(self, gs: GameState, rootMoves, depth, bestMoveId=None, storeRoot=True):
+        alpha = -CHECKMATE-1
+        bestMove = None
+        for move in orderMoves(rootMoves, bestMoveId):
+            gs.make_move(move)
+            nextMoves = gs.get_valid_moves()
+            score = -self.negaMax(gs, nextMoves, depth-1, -CHECKMATE-1, -alpha, 1)
+            gs.undo_move()
+            if score > alpha:
+                alpha = score
+                bestMove = move
+        if storeRoot:
+            self.tt.put(gs.hash, depth, scoreToTT(alpha, 0), TT_EXACT, bestMove.move_id)
+        return bestMove, alpha
+
+    def searchRootMultiPV(self, gs: GameState, rootMoves, depth, numPV, previousLines=()):
+        # search the root once per line, excluding the moves of the lines
+        # already found; later lines reuse the table filled by earlier ones
+        lines = []
+        excluded = set()
+        for k in range(min(numPV, len(rootMoves))):
+            candidates = [m for m in rootMoves if m.move_id not in excluded]
+            hint = previousLines[k][0].move_id if k < len(previousLines) else None
+            move, score = self.searchRoot(gs, candidates, depth, hint, storeRoot=(k == 0))
+            lines.append((move, score))
+            excluded.add(move.move_id)
+        return lines
+
+    def principalVariation(self, gs: GameState, firstMove, maxLength):
+        pv = [firstMove]
+        gs.make_move(firstMove)
+        made = 1
+        while made < maxLength:
+            entry = self.tt.get(gs.hash)
+            if entry is None or entry[3] is None:
+                break
+            nextMove = None
+            for m in gs.get_valid_moves():
+                if m.move_id == entry[3]:
+                    nextMove = m
+                    break
+            if nextMove is None:
+                break
+            pv.append(nextMove)
+            gs.make_move(nextMove)
+            made += 1
+        for _ in range(made):
+            gs.undo_move()
+        return pv
+
+    def searchMultiPV(self, gs: GameState, validMoves, numPV=3, maxDepth=DEPTH, timeLimit=None, onDepth=None):
+        '''
+        Deepen one ply at a time until maxDepth or timeLimit (seconds) runs
+        out, returning the best numPV root moves of the last completed depth
+        as SearchResults, best first. onDepth is called with the list of
+        lines after each completed depth.
+        '''
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + timeLimit if timeLimit is not None else None
+        historyLength = len(gs.move_log)
+        rootMoves = list(validMoves)
+        lines = []
+        results = []
+        if len(rootMoves) == 0:
+            return results
+
+        for depth in range(1, maxDepth+1):
+            try:
+                lines = self.searchRootMultiPV(gs, rootMoves, depth, numPV, lines)
+            except SearchTimeout:
+                while len(gs.move_log) > historyLength:
+                    gs.undo_move()
+                break
+            elapsed = time.perf_counter() - start
+            results = [SearchResult(move, score, depth, self.principalVariation(gs, move, depth),
+                                    self.nodes, elapsed) for move, score in lines]
+            if onDepth is not None:
+                onDepth(results)
+            if all(abs(score) > MATE_THRESHOLD for _, score in lines):
+                break
+
+        self.deadline = None
+        if len(results) == 0:
+            # out of time before depth 1 finished, fall back to any legal move
+            results = [SearchResult(orderMoves(rootMoves)[0], 0, 0, [], self.nodes,
+                                    time.perf_counter() - start)]
+        return results
+
+    def search(self, gs: GameState, validMoves, maxDepth=DEPTH, timeLimit=None, onDepth=None):
+        callback = (lambda lines: onDepth(lines[0])) if onDepth is not None else None
+        results = self.searchMultiPV(gs, validMoves, 1, maxDepth, timeLimit, callback)
+        return results[0] if results else None
+
+
+def findBookMove(gs: GameState, validMoves, book, minGames=1):
+    # pick among the book moves in proportion to how often they were played;
+    # book is a ChessBook.OpeningBook (or None for no book)
+    if book is None:
+        return None
+    candidates = [(m, e.games) for m, e in book.moves(gs, validMoves) if e.games >= minGames]
+    if len(candidates) == 0:
+        return None
+    pick = rng.randint(1, sum(games for _, games in candidates))
+    for m, games in candidates:
+        pick -= games
+        if pick <= 0:
+            return m
+
+
+def findMateMove(gs: GameState, validMoves, maxMoves=3, maxNodes=20000):
+    # first move of a shortest proven forced mate, or None
+    if len(validMoves) == 0:
+        return None
+    for move in validMoves:
+        gs.make_move(move)
+        gs.get_valid_moves()
+        mate = gs.checkmate
+        gs.undo_move()
+        if mate:
+            return move
+    result = MateSolver(maxMoves, maxNodes).solve(gs)
+    return result.line[0] if result.proven else None
+
+
+def findBestMoveNegaMaxAlphaBeta(gs: GameState, validMoves, depth=DEPTH, timeLimit=None, mateNodes=0):
+    # with mateNodes > 0 the mate solver gets that many nodes before the search
+    if mateNodes > 0:
+        mateMove = findMateMove(gs, validMoves, maxNodes=mateNodes)
+        if mateMove is not None:
+            return mateMove
+    return Searcher().search(gs, validMoves, depth, timeLimit).move
+
+
+def findBestMovesMultiPV(gs: GameState, validMoves, numPV=3, depth=DEPTH, timeLimit=None):
+    return Searcher().searchMultiPV(gs, validMoves, numPV, depth, timeLimit)
+
+
+'''
+Positional evaluation: material plus pawn structure and king shelter, with
+the pawn terms cached by pawn hash and whole evaluations cached by position
+hash.
+'''
+
+DOUBLED_PAWN = -0.2
+ISOLATED_PAWN = -0.15
+# indexed by how many ranks the pawn has advanced from its starting rank
+PASSED_PAWN = [0, 0.1, 0.2, 0.35, 0.6, 0.9]
+SHELTER_PAWN = 0.1
+SHELTER_MISSING = -0.15
+
+
+class HashCache():
+    # fixed capacity, indexed by the low bits of the key; a new entry
+    # always overwrites whatever was in its slot
+    def __init__(self, size=1 << 16) -> None:
+        if size & (size - 1):
+            raise ValueError("size must be a power of two")
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.values = [None] * size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        i = key & self.mask
+        if self.keys[i] == key:
+            self.hits += 1
+            return self.values[i]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        i = key & self.mask
+        self.keys[i] = key
+        self.values[i] = value
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+
+
+def scorePawnStructure(board):
+    # returns (score, whiteShelter, blackShelter); the shelter lists hold, per
+    # file, the row of the pawn closest to that side's back rank (or None)
+    whiteRows = [[] for _ in range(8)]
+    blackRows = [[] for _ in range(8)]
+    for r in range(8):
+        for c in range(8):
+            if board[r][c] == 'wp':
+                whiteRows[c].append(r)
+            elif board[r][c] == 'bp':
+                blackRows[c].append(r)
+
+    score = 0
+    for c in range(8):
+        for own, enemy, sign in ((whiteRows, blackRows, 1), (blackRows, whiteRows, -1)):
+            rows = own[c]
+            if not rows:
+                continue
+            if len(rows) > 1:
+                score += sign*DOUBLED_PAWN*(len(rows)-1)
+            neighbours = (own[c-1] if c > 0 else []) + (own[c+1] if c < 7 else [])
+            if not neighbours:
+                score += sign*ISOLATED_PAWN*len(rows)
+            for r in rows:
+                blockers = enemy[c] + (enemy[c-1] if c > 0 else []) + (enemy[c+1] if c < 7 else [])
+                if sign == 1 and all(b >= r for b in blockers):
+                    score += PASSED_PAWN[6-r]
+                elif sign == -1 and all(b <= r for b in blockers):
+                    score -= PASSED_PAWN[r-1]
+
+    whiteShelter = [max(rows) if rows else None for rows in whiteRows]
+    blackShelter = [min(rows) if rows else None for rows in blackRows]
+    return score, whiteShelter, blackShelter
+
+
+def scoreKingShelter(kingLoc, shelter, sign):
+    r, c = kingLoc
+    # only a king still on its own side of the board is sheltered by pawns
+    if (sign == 1 and r < 6) or (sign == -1 and r > 1):
+        return 0
+    score = 0
+    for f in range(max(0, c-1), min(7, c+1)+1):
+        row = shelter[f]
+        if row is not None and 0 < sign*(r-row) <= 2:
+            score += SHELTER_PAWN
+        else:
+            score += SHELTER_MISSING
+    return sign*score
+
+
+class Evaluator():
+    def __init__(self, pawnCacheSize=1 << 14, evalCacheSize=1 << 16) -> None:
+        self.pawnCache = HashCache(pawnCacheSize)
+        self.evalCache = HashCache(evalCacheSize)
+
+    def scoreBoard(self, gs: GameState):
+        # drop-in replacement for scoreBoard (positive is good for white)
+        if gs.checkmate:
+            return -CHECKMATE if gs.white_to_move else CHECKMATE
+        if gs.stalemate:
+            return -STALEMATE if gs.white_to_move else STALEMATE
+
+        score = self.evalCache.get(gs.hash)
+        if score is not None:
+            return score
+
+        pawns = self.pawnCache.get(gs.pawn_hash)
+        if pawns is None:
+            pawns = scorePawnStructure(gs.board)
+            self.pawnCache.put(gs.pawn_hash, pawns)
+        pawnScore, whiteShelter, blackShelter = pawns
+
+        score = scoreMaterial(gs.board) + pawnScore
+        score += scoreKingShelter(gs.white_king_loc, whiteShelter, 1)
+        score += scoreKingShelter(gs.black_king_loc, blackShelter, -1)
+        self.evalCache.put(gs.hash, score)
+        return score
+
+    def stats(self):
+        return {
+            "pawnHits": self.pawnCache.hits,
+            "pawnHitRate": self.pawnCache.hitRate(),
+            "evalHits": self.evalCache.hits,
+            "evalHitRate": self.evalCache.hitRate(),
+        }
@@ -0,0 +1,215 @@
+'''
+Reproducible engine benchmark.
+
+Runs a fixed set of positions through move generation, make/undo cycles
+(perft), evaluation and a fixed-depth search, then prints a node signature
+and the throughput of each phase. The signature only changes when engine
+behaviour changes. The timings are what you compare between runs.
+
+    python ChessBench.py                                  # print results
+    python ChessBench.py --json bench.json                # save them
+    python ChessBench.py --baseline bench.json --threshold 0.1
+    python ChessBench.py --startup                        # import and first-move latency
+
+With --baseline the exit status is 1 when any phase is more than
+threshold slower than the stored run. --startup times fresh interpreters,
+which is what short-lived worker processes pay before their first search.
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from ChessEngine import GameState
+import ChessAI
+
+BENCH_VERSION = 1
+SEED = 0
+
+# (FEN, perft depth, search depth)
+BENCH_POSITIONS = [
+    ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 4, 4),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 3, 3),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 4, 5),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 3, 3),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 3, 3),
+    ("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4", 3, 4),
+    ("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 4, 4),
+]
+MOVEGEN_ITERATIONS = 200
+STARTUP_RUNS = 10
+
+# runs in a fresh interpreter: time the engine imports, then a first search
+# from the start position at the default depth
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from ChessEngine import GameState
+import ChessAI
+imported = time.perf_counter()
+gs = GameState()
+ChessAI.Searcher().search(gs, gs.get_valid_moves(), ChessAI.DEPTH)
+moved = time.perf_counter()
+import json  # after timing, as it pulls in modules the engine does not need
+print(json.dumps({"import": imported - start, "first_move": moved - imported}))
+"""
+
+
+def perft(gs: GameState, depth):
+    moves = gs.get_valid_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for m in moves:
+        gs.make_move(m)
+        nodes += perft(gs, depth-1)
+        gs.undo_move()
+    return nodes
+
+
+def bench_movegen(positions):
+    count = 0
+    for fen, _, _ in positions:
+        gs = GameState.from_fen(fen)
+        for _ in range(MOVEGEN_ITERATIONS):
+            count += len(gs.get_valid_moves())
+    return count, count
+
+
+def bench_make_undo(positions):
+    nodes = 0
+    for fen, depth, _ in positions:
+        nodes += perft(GameState.from_fen(fen), depth)
+    return nodes, nodes
+
+
+def bench_eval(positions):
+    # every position up to two plies from the bench positions, through both
+    # the material count and the cached positional evaluator
+    count = 0
+    checksum = 0
+    evaluator = ChessAI.Evaluator()
+    for fen, _, _ in positions:
+        gs = GameState.from_fen(fen)
+        for m in gs.get_valid_moves():
+            gs.make_move(m)
+            for reply in gs.get_valid_moves():
+                gs.make_move(reply)
+                checksum += round(100*ChessAI.scoreBoard(gs)) + round(100*evaluator.scoreBoard(gs))
+                count += 2
+                gs.undo_move()
+            gs.undo_move()
+    return count, checksum
+
+
+def bench_search(positions):
+    nodes = 0
+    for fen, _, depth in positions:
+        gs = GameState.from_fen(fen)
+        searcher = ChessAI.Searcher()
+        searcher.search(gs, gs.get_valid_moves(), depth)
+        nodes += searcher.nodes
+    return nodes, nodes
+
+
+PHASES = [
+    ("movegen", bench_movegen),
+    ("make_undo", bench_make_undo),
+    ("eval", bench_eval),
+    ("search", bench_search),
+]
+
+
+def run_bench(positions=BENCH_POSITIONS, repeat=1, report=None):
+    ChessAI.seed(SEED)
+    results = {"version": BENCH_VERSION, "python": platform.python_version(), "phases": {}}
+    signature = 0
+    for name, phase in PHASES:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count, check = phase(positions)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results["phases"][name] = {
+            "count": count,
+            "check": check,
+            "seconds": round(best, 4),
+            "rate": round(count/best, 1) if best > 0 else 0.0,
+        }
+        signature += check
+        if report is not None:
+            report(name, results["phases"][name])
+    results["signature"] = signature
+    return results
+
+
+def measure_startup(runs=STARTUP_RUNS):
+    # median seconds for the whole process, the engine imports and the first
+    # search, over runs fresh interpreters
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], check=True,
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        sample = json.loads(output)
+        sample["process"] = time.perf_counter() - start
+        samples.append(sample)
+    return {key: round(statistics.median(s[key] for s in samples), 4)
+            for key in ("process", "import", "first_move")}
+
+
+def compare(results, baseline, threshold):
+    # returns a list of regression messages; empty means no regression
+    regressions = []
+    if baseline.get("signature") != results["signature"]:
+        print("warning: signature {} differs from baseline {}, engine behaviour changed".format(
+            results["signature"], baseline.get("signature")))
+    for name, phase in results["phases"].items():
+        base = baseline.get("phases", {}).get(name)
+        if base is None or base["rate"] <= 0:
+            continue
+        change = phase["rate"]/base["rate"] - 1
+        print("{:<10} {:>+7.1%} vs baseline".format(name, change))
+        if change < -threshold:
+            regressions.append("{} is {:.1%} slower than baseline".format(name, -change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="reproducible engine benchmark")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against results stored with --json")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed throughput drop before failing (default 0.1 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per phase, the fastest counts")
+    parser.add_argument("--startup", action="store_true",
+                        help="also time engine imports and the first move in fresh interpreters")
+    args = parser.parse_args()
+
+    def report(name, phase):
+        print("{:<10} {:>9} in {:>7.3f} s  {:>10.1f} /s".format(
+            name, phase["count"], phase["seconds"], phase["rate"]))
+
+    results = run_bench(repeat=args.repeat, report=report)
+    print("signature  {}".format(results["signature"]))
+    if args.startup:
+        results["startup"] = measure_startup()
+        print("startup    process {process:.3f} s  import {import:.3f} s  first move {first_move:.3f} s".format(
+            **results["startup"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for message in regressions:
+            print("regression: " + message)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,255 @@
+'''
+On-disk opening tree built from game databases.
+
+The builder replays games (PGN with SAN moves, or one game per line in
+coordinate notation, each ending in a result token) through GameState and
+counts, for every (position hash, move) pair in the first max_plies plies,
+how many games it was played in and how those games ended. Counts are
+collected in memory up to run_limit keys, spilled as sorted run files and
+merged, so databases larger than RAM can be indexed.
+
+The index is a header followed by fixed-size records sorted by
+(hash, move). OpeningBook memory-maps it and binary-searches by hash, so
+a lookup is O(log n) and never loads the file.
+
+    python ChessBook.py build games.pgn book.idx --max-plies 30
+    python ChessBook.py query book.idx e2e4 e7e5
+'''
+import argparse
+import heapq
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+from ChessEngine import GameState, encode_move, decode_move
+
+MAGIC = b"CBIX"
+VERSION = 1
+HEADER = struct.Struct("<4sIQ")
+RECORD = struct.Struct("<QHIII")  # hash, move, white wins, draws, black wins
+RESULTS = {"1-0": 0, "1/2-1/2": 1, "0-1": 2, "*": None}
+MAX_PLIES = 30
+RUN_LIMIT = 1 << 20
+
+_comment = re.compile(r"\{[^}]*\}|;[^\n]*")
+_move_number = re.compile(r"^\d+\.+")
+
+
+def read_games(lines):
+    # yields (move tokens, result index or None) for every game in a PGN or
+    # coordinate-notation stream, skipping tags, comments, NAGs and variations
+    tokens = []
+    depth = 0
+    for line in lines:
+        line = line.strip()
+        if line.startswith('['):
+            continue
+        for token in _comment.sub(" ", line).replace("(", " ( ").replace(")", " ) ").split():
+            if token == "(":
+                depth += 1
+                continue
+            if token == ")":
+                depth = max(0, depth - 1)
+                continue
+            if depth > 0 or token.startswith("$"):
+                continue
+            if token in RESULTS:
+                yield tokens, RESULTS[token]
+                tokens = []
+                continue
+            token = _move_number.sub("", token)
+            if token:
+                tokens.append(token)
+
+
+def game_records(tokens, max_plies):
+    # (hash, move code) for each ply played; stops at the first illegal move
+    gs = GameState()
+    records = []
+    for token in tokens[:max_plies]:
+        try:
+            move = gs.parse_move(token)
+        except ValueError:
+            break
+        records.append((gs.hash, encode_move(move)))
+        gs.make_move(move)
+    return records
+
+
+def write_run(counts, directory):
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        for (key, move) in sorted(counts):
+            f.write(RECORD.pack(key, move, *counts[(key, move)]))
+    return path
+
+
+def read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            if not chunk:
+                break
+            for record in RECORD.iter_unpack(chunk):
+                yield record
+
+
+def merge_runs(run_paths, out_path):
+    count = 0
+    with open(out_path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0))
+        current = None
+        for key, move, w, d, b in heapq.merge(*(read_run(p) for p in run_paths)):
+            if current is not None and current[0] == key and current[1] == move:
+                current[2] += w
+                current[3] += d
+                current[4] += b
+                continue
+            if current is not None:
+                f.write(RECORD.pack(*current))
+                count += 1
+            current = [key, move, w, d, b]
+        if current is not None:
+            f.write(RECORD.pack(*current))
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, count))
+    os.replace(out_path + ".tmp", out_path)
+    return count
+
+
+def build_book(game_lines, out_path, max_plies=MAX_PLIES, run_limit=RUN_LIMIT, report=None):
+    '''
+    Build an index from an iterable of text lines and return the number of
+    (position, move) records written. Memory is bounded by run_limit keys.
+    '''
+    directory = tempfile.mkdtemp(prefix="book-", dir=os.path.dirname(os.path.abspath(out_path)))
+    runs = []
+    counts = {}
+    games = 0
+    try:
+        for tokens, result in read_games(game_lines):
+            if result is None:
+                continue
+            for key in game_records(tokens, max_plies):
+                entry = counts.get(key)
+                if entry is None:
+                    entry = counts[key] = [0, 0, 0]
+                entry[result] += 1
+            games += 1
+            if len(counts) >= run_limit:
+                runs.append(write_run(counts, directory))
+                counts = {}
+            if report is not None and games % 1000 == 0:
+                report(games)
+        if counts or not runs:
+            runs.append(write_run(counts, directory))
+        return merge_runs(runs, out_path)
+    finally:
+        for path in runs:
+            os.remove(path)
+        os.rmdir(directory)
+
+
+class BookEntry():
+    def __init__(self, move_code, white, draws, black) -> None:
+        self.move_code = move_code
+        self.white = white
+        self.draws = draws
+        self.black = black
+
+    @property
+    def games(self):
+        return self.white + self.draws + self.black
+
+    def score(self, white_to_move):
+        # average result for the side that plays the move, 1 = always wins
+        if self.games == 0:
+            return 0.5
+        wins = self.white if white_to_move else self.black
+        return (wins + 0.5*self.draws) / self.games
+
+
+class OpeningBook():
+    def __init__(self, path) -> None:
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} opening book".format(path, VERSION))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key_at(self, i):
+        return struct.unpack_from("<Q", self.map, HEADER.size + i*RECORD.size)[0]
+
+    def lookup(self, key):
+        # entries for one position hash, most played first
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        entries = []
+        i = lo
+        while i < self.count:
+            record = RECORD.unpack_from(self.map, HEADER.size + i*RECORD.size)
+            if record[0] != key:
+                break
+            entries.append(BookEntry(*record[1:]))
+            i += 1
+        entries.sort(key=lambda e: e.games, reverse=True)
+        return entries
+
+    def moves(self, gs: GameState, valid_moves=None):
+        # (Move, BookEntry) pairs for the current position, most played first
+        if valid_moves is None:
+            valid_moves = gs.get_valid_moves()
+        result = []
+        for entry in self.lookup(gs.hash):
+            move = decode_move(entry.move_code, valid_moves)
+            if move is not None:
+                result.append((move, entry))
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="build or query an opening book index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index a PGN or coordinate-notation game file")
+    build.add_argument("games")
+    build.add_argument("index")
+    build.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    build.add_argument("--run-limit", type=int, default=RUN_LIMIT, help="keys held in memory per run")
+    query = commands.add_parser("query", help="show book moves after the given moves")
+    query.add_argument("index")
+    query.add_argument("moves", nargs="*")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.games, encoding="utf-8", errors="replace") as f:
+            count = build_book(f, args.index, args.max_plies, args.run_limit,
+                               lambda games: print("\r{} games".format(games), end="", flush=True))
+        print("\n{} records written to {}".format(count, args.index))
+    else:
+        gs = GameState()
+        for text in args.moves:
+            gs.make_move(gs.parse_move(text))
+        with OpeningBook(args.index) as book:
+            for move, entry in book.moves(gs):
+                print("{:<6} {:>8} games  +{} ={} -{}  score {:.2f}".format(
+                    move.get_chess_notation(), entry.games, entry.white, entry.draws,
+                    entry.black, entry.score(gs.white_to_move)))
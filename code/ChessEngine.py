@@ -1,3 +1,110 @@
+import random
+
+# Packed position layout (POSITION_SIZE bytes):
+#   0-31  board, one nibble per square (row-major, high nibble first)
+#   32    bit 0 side to move (1 = white), bits 1-4 castle rights wks/wqs/bks/bqs
+#   33    en-passant square index, or NO_SQUARE
+#   34    halfmove clock (saturates at 255)
+#   35-36 fullmove number, little endian
+POSITION_SIZE = 37
+NO_SQUARE = 0xFF
+PIECE_CODES = ['--', 'wp', 'wn', 'wb', 'wr', 'wq', 'wk',
+               'bp', 'bn', 'bb', 'br', 'bq', 'bk']
+PIECE_TO_CODE = {piece: code for code, piece in enumerate(PIECE_CODES)}
+SQUARES = [(r, c) for r in range(8) for c in range(8)]
+
+CASTLE_WKS = 1
+CASTLE_WQS = 2
+CASTLE_BKS = 4
+CASTLE_BQS = 8
+CASTLE_ALL = CASTLE_WKS | CASTLE_WQS | CASTLE_BKS | CASTLE_BQS
+# rights that survive a move touching a square (as start or end square),
+# so moving the king or a rook, or capturing a rook, drops the right
+CASTLE_MASK = [CASTLE_ALL] * 64
+CASTLE_MASK[0] = CASTLE_ALL & ~CASTLE_BQS
+CASTLE_MASK[4] = CASTLE_ALL & ~(CASTLE_BKS | CASTLE_BQS)
+CASTLE_MASK[7] = CASTLE_ALL & ~CASTLE_BKS
+CASTLE_MASK[56] = CASTLE_ALL & ~CASTLE_WQS
+CASTLE_MASK[60] = CASTLE_ALL & ~(CASTLE_WKS | CASTLE_WQS)
+CASTLE_MASK[63] = CASTLE_ALL & ~CASTLE_WKS
+
+# Zobrist keys, seeded so hashes are stable across processes and runs
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_PIECE = [[0] * 64] + [[_zobrist_rng.getrandbits(64) for _ in range(64)]
+                              for _ in range(len(PIECE_CODES) - 1)]
+ZOBRIST_CASTLE = [_zobrist_rng.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP = [_zobrist_rng.getrandbits(64) for _ in range(8)]
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+# Undo record, UNDO_RECORD_SIZE words per ply on GameState.undo_stack:
+#   word 0  castle rights (4 bits) | en-passant square (7 bits, 64 = none)
+#           | captured piece code (4 bits) | halfmove clock (16 bits)
+#   word 1  position hash
+#   word 2  pawn hash
+UNDO_RECORD_SIZE = 3
+UNDO_EP_SHIFT = 4
+UNDO_CAPTURED_SHIFT = 11
+UNDO_HALFMOVE_SHIFT = 15
+UNDO_NO_EP = 64
+
+# Move tables, computed once per process and indexed by square (row*8 + col).
+# Entries are the (row, col) tuples of SQUARES, so generators and attack
+# scans walk them without offset arithmetic or bounds checks.
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+# order used by check/pin scans: orthogonal directions 0-3, diagonal 4-7
+ATTACK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1),
+                     (-1, -1), (-1, 1), (1, -1), (1, 1))
+KING_STEPS = ((1, 1), (1, 0), (1, -1), (0, 1),
+              (0, -1), (-1, 1), (-1, 0), (-1, -1))
+KNIGHT_STEPS = ((2, 1), (2, -1), (-2, 1), (-2, -1),
+                (1, 2), (1, -2), (-1, 2), (-1, -2))
+
+
+def _rays(d):
+    # RAYS[d] for every square, filled from the edge the direction points at
+    # so each ray is the next square followed by that square's ray
+    dr, dc = d
+    rays = [()] * 64
+    for r in (range(7, -1, -1) if dr > 0 else range(8)):
+        for c in (range(7, -1, -1) if dc > 0 else range(8)):
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < 8 and 0 <= nc < 8:
+                rays[r*8 + c] = (SQUARES[nr*8 + nc],) + rays[nr*8 + nc]
+    return rays
+
+
+def _steps(r, c, steps):
+    return tuple(SQUARES[(r+i)*8 + c+j] for i, j in steps if 0 <= r+i < 8 and 0 <= c+j < 8)
+
+
+def _between():
+    table = [[0] * 64 for _ in range(64)]
+    for rays in RAYS.values():
+        for row, ray in zip(table, rays):
+            mask = 0
+            for r, c in ray:
+                row[r*8 + c] = mask
+                mask |= 1 << (r*8 + c)
+    return table
+
+
+# RAYS[d][sq]: squares from sq outwards along direction d, nearest first
+RAYS = {d: _rays(d) for d in QUEEN_DIRECTIONS}
+# per square, the rays in the order of ROOK_DIRECTIONS, BISHOP_DIRECTIONS, ...
+ROOK_RAYS = list(zip(*(RAYS[d] for d in ROOK_DIRECTIONS)))
+BISHOP_RAYS = list(zip(*(RAYS[d] for d in BISHOP_DIRECTIONS)))
+QUEEN_RAYS = list(zip(*(RAYS[d] for d in QUEEN_DIRECTIONS)))
+ATTACK_RAYS = list(zip(*(RAYS[d] for d in ATTACK_DIRECTIONS)))
+KING_NEIGHBOURS = [_steps(r, c, KING_STEPS) for r, c in SQUARES]
+KNIGHT_TARGETS = [_steps(r, c, KNIGHT_STEPS) for r, c in SQUARES]
+# BETWEEN[a][b]: bitmask (bit row*8 + col) of the squares strictly between
+# a and b when they share a rank, file or diagonal, 0 otherwise; masks are
+# plain ints, so the 4096 entries cost no container allocations
+BETWEEN = _between()
+
+
 class Move():
     def __init__(self, start_sq, end_sq, board, is_enpassant=False, is_castle=False, promotion_choice=None) -> None:
         self.start_row = start_sq[0]
@@ -63,14 +170,6 @@ class Move():
         return False
 
 
-class CastleRights():
-    def __init__(self, wks, wqs, bks, bqs) -> None:
-        self.wks = wks
-        self.wqs = wqs
-        self.bks = bks
-        self.bqs = bqs
-
-
 class GameState():
     def __init__(self) -> None:
         self.board = [
@@ -84,21 +183,6 @@ class GameState():
             ['wr', 'wn', 'wb', "wq", 'wk', 'wb', 'wn', 'wr'],
         ]
 
-        self.move_function = {
-            'p': self.get_pawn_moves,
-            'k': self.get_king_moves,
-            'r': self.get_rook_moves,
-            'n': self.get_knight_moves,
-            'b': self.get_bishop_moves,
-            'q': self.get_queen_moves,
-        }
-
-        self.king_moves = [[1, 1], [1, 0], [1, -1],
-                           [0, 1], [0, -1], [-1, 1], [-1, 0], [-1, -1]]
-
-        self.knight_moves = [[2, 1], [2, -1], [-2, 1],
-                             [-2, -1], [1, 2], [1, -2], [-1, 2], [-1, -2]]
-
         self.white_to_move = True
         self.move_log: list[Move] = []
         self.white_king_loc = (7, 4)
@@ -109,16 +193,71 @@ class GameState():
         self.checkmate = False
         self.stalemate = False
         self.enpassant_square = ()
-        self.current_castle_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [
-            self.copy_castle_rights(self.current_castle_rights)]
-
-    def copy_castle_rights(self, cr: CastleRights) -> CastleRights:
-        return CastleRights(cr.wks, cr.wqs, cr.bks, cr.bqs)
+        self.castle_rights = CASTLE_ALL
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.undo_stack = []
+        # optional incrementally updated evaluator (see ChessNNUE)
+        self.nnue = None
+        self.hash = self.compute_hash()
+        self.pawn_hash = self.compute_pawn_hash()
+
+    def compute_pawn_hash(self):
+        # keyed on pawn placement only, for caching pawn-structure terms
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c][1] == 'p':
+                    h ^= ZOBRIST_PIECE[PIECE_TO_CODE[self.board[r][c]]][r*8 + c]
+        return h
+
+    def compute_hash(self):
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                h ^= ZOBRIST_PIECE[PIECE_TO_CODE[self.board[r][c]]][r*8 + c]
+        h ^= ZOBRIST_CASTLE[self.castle_rights]
+        if self.enpassant_square != ():
+            h ^= ZOBRIST_EP[self.enpassant_square[1]]
+        if not self.white_to_move:
+            h ^= ZOBRIST_SIDE
+        return h
 
     def make_move(self, move: Move):
-        self.board[move.start_row][move.start_col] = "--"
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        board = self.board
+        start_sq = move.start_row*8 + move.start_col
+        end_sq = move.end_row*8 + move.end_col
+        captured_code = PIECE_TO_CODE[move.piece_captured]
+        ep_sq = self.enpassant_square[0]*8 + \
+            self.enpassant_square[1] if self.enpassant_square != () else UNDO_NO_EP
+        self.undo_stack.append(self.castle_rights | (ep_sq << UNDO_EP_SHIFT) | (
+            captured_code << UNDO_CAPTURED_SHIFT) | (min(self.halfmove_clock, 0xFFFF) << UNDO_HALFMOVE_SHIFT))
+        self.undo_stack.append(self.hash)
+        self.undo_stack.append(self.pawn_hash)
+
+        h = self.hash ^ ZOBRIST_SIDE
+        if ep_sq != UNDO_NO_EP:
+            h ^= ZOBRIST_EP[ep_sq & 7]
+
+        if move.piece_moved[1] == 'p':
+            self.pawn_hash ^= ZOBRIST_PIECE[PIECE_TO_CODE[move.piece_moved]][start_sq]
+            if not move.is_promotion:
+                self.pawn_hash ^= ZOBRIST_PIECE[PIECE_TO_CODE[move.piece_moved]][end_sq]
+        if move.piece_captured[1] == 'p':
+            self.pawn_hash ^= ZOBRIST_PIECE[captured_code][
+                move.start_row*8 + move.end_col if move.is_enpassant else end_sq]
+
+        if move.piece_moved[1] == 'p' or captured_code != 0:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not self.white_to_move:
+            self.fullmove_number += 1
+
+        moved_code = PIECE_TO_CODE[move.piece_moved]
+        board[move.start_row][move.start_col] = "--"
+        board[move.end_row][move.end_col] = move.piece_moved
+        h ^= ZOBRIST_PIECE[moved_code][start_sq]
         self.move_log.append(move)
         self.white_to_move = not self.white_to_move
         if (move.piece_moved == 'wk'):
@@ -127,35 +266,54 @@ class GameState():
             self.black_king_loc = (move.end_row, move.end_col)
 
         if move.is_enpassant:
-            self.board[move.start_row][move.end_col] = "--"
+            board[move.start_row][move.end_col] = "--"
+            h ^= ZOBRIST_PIECE[captured_code][move.start_row*8 + move.end_col]
+        else:
+            h ^= ZOBRIST_PIECE[captured_code][end_sq]
 
         if move.piece_moved[1] == 'p' and abs(move.end_row - move.start_row) == 2:
-            self.enpassant_square = (
-                (move.start_row + move.end_row)//2, move.end_col)
+            self.enpassant_square = SQUARES[(start_sq + end_sq)//2]
+            h ^= ZOBRIST_EP[move.end_col]
         else:
             self.enpassant_square = ()
 
         if move.is_promotion:
             choice = move.promotion_choice
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + choice
+            board[move.end_row][move.end_col] = move.piece_moved[0] + choice
+            h ^= ZOBRIST_PIECE[PIECE_TO_CODE[move.piece_moved[0] + choice]][end_sq]
+        else:
+            h ^= ZOBRIST_PIECE[moved_code][end_sq]
 
         if move.is_castle:
+            rook_code = PIECE_TO_CODE[move.piece_moved[0]+'r']
             if move.end_col - move.start_col == 2:
-                self.board[move.end_row][move.end_col -
-                                         1] = move.piece_moved[0]+'r'
-                self.board[move.end_row][7] = '--'
+                board[move.end_row][move.end_col -
+                                    1] = move.piece_moved[0]+'r'
+                board[move.end_row][7] = '--'
+                h ^= ZOBRIST_PIECE[rook_code][end_sq-1] ^ ZOBRIST_PIECE[rook_code][end_sq+1]
             else:
-                self.board[move.end_row][move.end_col +
-                                         1] = move.piece_moved[0]+'r'
-                self.board[move.end_row][0] = '--'
-
-        self.update_castle_rights(move)
+                board[move.end_row][move.end_col +
+                                    1] = move.piece_moved[0]+'r'
+                board[move.end_row][0] = '--'
+                h ^= ZOBRIST_PIECE[rook_code][end_sq+1] ^ ZOBRIST_PIECE[rook_code][end_sq-2]
+
+        castle_rights = self.castle_rights & CASTLE_MASK[start_sq] & CASTLE_MASK[end_sq]
+        if castle_rights != self.castle_rights:
+            h ^= ZOBRIST_CASTLE[self.castle_rights] ^ ZOBRIST_CASTLE[castle_rights]
+            self.castle_rights = castle_rights
+        self.hash = h
+        if self.nnue is not None:
+            self.nnue.push(self, move)
 
     def undo_move(self):
         if len(self.move_log) > 0:
             move = self.move_log.pop()
+            self.pawn_hash = self.undo_stack.pop()
+            self.hash = self.undo_stack.pop()
+            record = self.undo_stack.pop()
+            captured = PIECE_CODES[(record >> UNDO_CAPTURED_SHIFT) & 0xF]
             self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
+            self.board[move.end_row][move.end_col] = captured
             self.white_to_move = not self.white_to_move
             # print("undone move "+move.get_chess_notation())
             if (move.piece_moved == 'wk'):
@@ -165,12 +323,7 @@ class GameState():
 
             if move.is_enpassant:
                 self.board[move.end_row][move.end_col] = '--'
-                # has to be fixed
-                self.board[move.start_row][move.end_col] = move.piece_captured
-                self.enpassant_square = (move.end_row, move.end_col)
-
-            if move.piece_moved[1] == 'p' and abs(move.end_row - move.start_row) == 2:
-                self.enpassant_square = ()
+                self.board[move.start_row][move.end_col] = captured
 
             if move.is_castle:
                 if move.end_col - move.start_col == 2:
@@ -180,35 +333,202 @@ class GameState():
                     self.board[move.end_row][move.end_col+1] = '--'
                     self.board[move.end_row][0] = move.piece_moved[0]+'r'
 
-            self.castle_rights_log.pop()
-            self.current_castle_rights = self.copy_castle_rights(
-                self.castle_rights_log[-1])
-            
+            self.castle_rights = record & CASTLE_ALL
+            ep_sq = (record >> UNDO_EP_SHIFT) & 0x7F
+            self.enpassant_square = SQUARES[ep_sq] if ep_sq != UNDO_NO_EP else ()
+            self.halfmove_clock = record >> UNDO_HALFMOVE_SHIFT
+            if not self.white_to_move:
+                self.fullmove_number -= 1
+            if self.nnue is not None:
+                self.nnue.pop()
+
             self.checkmate = False
             self.stalemate = False
 
-    def update_castle_rights(self, move: Move):
-        if move.piece_moved == 'wk':
-            self.current_castle_rights.wks = False
-            self.current_castle_rights.wqs = False
-        elif move.piece_moved == 'bk':
-            self.current_castle_rights.bks = False
-            self.current_castle_rights.bqs = False
-        elif move.piece_moved == 'wr':
-            if move.start_row == 7:
-                if move.start_col == 0:
-                    self.current_castle_rights.wqs = False
-                elif move.start_col == 7:
-                    self.current_castle_rights.wks = False
-        elif move.piece_moved == 'br':
-            if move.start_row == 0:
-                if move.start_col == 0:
-                    self.current_castle_rights.bqs = False
-                elif move.start_col == 7:
-                    self.current_castle_rights.bks = False
-
-        self.castle_rights_log.append(
-            self.copy_castle_rights(self.current_castle_rights))
+    def pack_into(self, buffer, offset=0):
+        board = self.board
+        for i in range(32):
+            r, c = divmod(2 * i, 8)
+            buffer[offset + i] = (PIECE_TO_CODE[board[r][c]] << 4) | PIECE_TO_CODE[board[r][c+1]]
+
+        buffer[offset + 32] = (1 if self.white_to_move else 0) | (self.castle_rights << 1)
+        if self.enpassant_square != ():
+            buffer[offset + 33] = self.enpassant_square[0] * 8 + self.enpassant_square[1]
+        else:
+            buffer[offset + 33] = NO_SQUARE
+        buffer[offset + 34] = min(self.halfmove_clock, 255)
+        buffer[offset + 35] = self.fullmove_number & 0xFF
+        buffer[offset + 36] = (self.fullmove_number >> 8) & 0xFF
+
+    def to_bytes(self) -> bytes:
+        buffer = bytearray(POSITION_SIZE)
+        self.pack_into(buffer)
+        return bytes(buffer)
+
+    @classmethod
+    def unpack_from(cls, buffer, offset=0) -> 'GameState':
+        # the move log is not part of the encoding, so the decoded state
+        # starts with an empty history and cannot undo past this position
+        board = [[None] * 8 for _ in range(8)]
+        for i in range(32):
+            byte = buffer[offset + i]
+            r, c = divmod(2 * i, 8)
+            board[r][c] = PIECE_CODES[byte >> 4]
+            board[r][c+1] = PIECE_CODES[byte & 0x0F]
+
+        flags = buffer[offset + 32]
+        ep = buffer[offset + 33]
+        gs = cls._blank()
+        gs.set_position(board, bool(flags & 1), (flags >> 1) & CASTLE_ALL,
+                        SQUARES[ep] if ep != NO_SQUARE else (), buffer[offset + 34],
+                        buffer[offset + 35] | (buffer[offset + 36] << 8))
+        return gs
+
+    @classmethod
+    def _blank(cls) -> 'GameState':
+        # an instance for set_position to fill in, skipping the start
+        # position and its hashes that __init__ would compute
+        gs = cls.__new__(cls)
+        gs.nnue = None
+        return gs
+
+    def set_position(self, board, white_to_move, castle_rights, enpassant_square, halfmove_clock=0, fullmove_number=1):
+        # replaces the whole position and forgets the move history
+        self.board = board
+        self.white_king_loc = ()
+        self.black_king_loc = ()
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == 'wk':
+                    self.white_king_loc = (r, c)
+                elif board[r][c] == 'bk':
+                    self.black_king_loc = (r, c)
+        self.white_to_move = white_to_move
+        self.castle_rights = castle_rights
+        self.enpassant_square = enpassant_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.move_log = []
+        self.undo_stack = []
+        self.is_in_check = False
+        self.pins = []
+        self.checks = []
+        self.checkmate = False
+        self.stalemate = False
+        self.hash = self.compute_hash()
+        self.pawn_hash = self.compute_pawn_hash()
+
+    @classmethod
+    def from_fen(cls, fen) -> 'GameState':
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("invalid FEN: {}".format(fen))
+        rows = fields[0].split('/')
+        if len(rows) != 8:
+            raise ValueError("invalid FEN: {}".format(fen))
+        board = []
+        for row in rows:
+            board_row = []
+            for ch in row:
+                if ch.isdigit():
+                    board_row.extend(['--'] * int(ch))
+                elif ch.lower() in 'pnbrqk':
+                    board_row.append(('w' if ch.isupper() else 'b') + ch.lower())
+                else:
+                    raise ValueError("invalid FEN: {}".format(fen))
+            if len(board_row) != 8:
+                raise ValueError("invalid FEN: {}".format(fen))
+            board.append(board_row)
+
+        castle_rights = 0
+        for ch, right in zip('KQkq', (CASTLE_WKS, CASTLE_WQS, CASTLE_BKS, CASTLE_BQS)):
+            if ch in fields[2]:
+                castle_rights |= right
+        ep = fields[3]
+        enpassant_square = (8 - int(ep[1]), ord(ep[0]) - ord('a')) if ep != '-' else ()
+        halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+
+        gs = cls._blank()
+        gs.set_position(board, fields[1] == 'w', castle_rights,
+                        enpassant_square, halfmove_clock, fullmove_number)
+        return gs
+
+    def parse_move(self, text, valid_moves=None) -> Move:
+        # accepts coordinate notation (e2e4, e7e8q) or SAN (Nf3, exd5, O-O, e8=Q+)
+        if valid_moves is None:
+            valid_moves = self.get_valid_moves()
+        text = original = text.strip().rstrip('+#!?')
+        for m in valid_moves:
+            if m.get_chess_notation() == text:
+                return m
+
+        if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            direction = 2 if len(text) == 3 else -2
+            for m in valid_moves:
+                if m.is_castle and m.end_col - m.start_col == direction:
+                    return m
+            raise ValueError("illegal move {}".format(original))
+
+        promotion = None
+        if '=' in text:
+            text, promotion = text.split('=', 1)
+            promotion = promotion[:1].lower()
+        elif len(text) > 2 and text[-1] in 'QRBN' and text[-2].isdigit():
+            text, promotion = text[:-1], text[-1].lower()
+        piece = 'p'
+        if text[:1] in ('N', 'B', 'R', 'Q', 'K'):
+            piece, text = text[0].lower(), text[1:]
+        text = text.replace('x', '').replace('-', '')
+        if len(text) < 2 or text[-2] not in 'abcdefgh' or text[-1] not in '12345678':
+            raise ValueError("cannot parse move {}".format(original))
+        end_row, end_col = 8 - int(text[-1]), ord(text[-2]) - ord('a')
+        hint = text[:-2]
+
+        found = None
+        for m in valid_moves:
+            if m.piece_moved[1] != piece or m.end_row != end_row or m.end_col != end_col:
+                continue
+            if m.is_promotion and m.promotion_choice != (promotion or 'q'):
+                continue
+            if any((ch in 'abcdefgh' and m.start_col != ord(ch) - ord('a')) or
+                   (ch in '12345678' and m.start_row != 8 - int(ch)) for ch in hint):
+                continue
+            if found is not None:
+                raise ValueError("ambiguous move {}".format(original))
+            found = m
+        if found is None:
+            raise ValueError("illegal move {}".format(original))
+        return found
+
+    def to_fen(self):
+        rows = []
+        for row in self.board:
+            text = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += piece[1].upper() if piece[0] == 'w' else piece[1]
+            rows.append(text + (str(empty) if empty else ''))
+        castling = ''.join(ch for ch, right in zip('KQkq', (CASTLE_WKS, CASTLE_WQS, CASTLE_BKS, CASTLE_BQS))
+                           if self.castle_rights & right)
+        ep = '-'
+        if self.enpassant_square != ():
+            ep = chr(ord('a') + self.enpassant_square[1]) + str(8 - self.enpassant_square[0])
+        return "{} {} {} {} {} {}".format('/'.join(rows), 'w' if self.white_to_move else 'b',
+                                          castling or '-', ep, self.halfmove_clock, self.fullmove_number)
+
+    @classmethod
+    def from_bytes(cls, data) -> 'GameState':
+        if len(data) != POSITION_SIZE:
+            raise ValueError("expected {} bytes, got {}".format(
+                POSITION_SIZE, len(data)))
+        return cls.unpack_from(data)
 
     def is_piece_pinned(self, r, c):
         piece_pinned = False
@@ -322,98 +642,55 @@ class GameState():
                 if (r+1, c+1) == self.enpassant_square:
                     moves.append(Move((r, c), (r+1, c+1), self.board, True))
 
-    def get_rook_moves(self, r, c, moves):
+    def get_slider_moves(self, r, c, moves, directions, rays):
         piece_pinned, pin_direction = self.is_piece_pinned(r, c)
-        directions = ((1, 0), (-1, 0), (0, 1), (0, -1))
+        ally_color = self.board[r][c][0]
 
-        for d in directions:
+        for d, ray in zip(directions, rays):
             if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]):
-                for i in range(1, 8):
-                    end_row = r + i*d[0]
-                    end_col = c + i*d[1]
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        if self.board[end_row][end_col] == '--':
-                            moves.append(
-                                Move((r, c), (end_row, end_col), self.board))
-                        else:
-                            if self.board[r][c][0] != self.board[end_row][end_col][0]:
-                                moves.append(
-                                    Move((r, c), (end_row, end_col), self.board))
-                            break
+                for end_sq in ray:
+                    end_piece = self.board[end_sq[0]][end_sq[1]]
+                    if end_piece == '--':
+                        moves.append(Move((r, c), end_sq, self.board))
                     else:
+                        if end_piece[0] != ally_color:
+                            moves.append(Move((r, c), end_sq, self.board))
                         break
 
-    def get_bishop_moves(self, r, c, moves):
-        piece_pinned, pin_direction = self.is_piece_pinned(r, c)
-        directions = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+    def get_rook_moves(self, r, c, moves):
+        self.get_slider_moves(r, c, moves, ROOK_DIRECTIONS, ROOK_RAYS[r*8 + c])
 
-        for d in directions:
-            if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]):
-                for i in range(1, 8):
-                    end_row = r + i*d[0]
-                    end_col = c + i*d[1]
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        if self.board[end_row][end_col] == '--':
-                            moves.append(
-                                Move((r, c), (end_row, end_col), self.board))
-                        else:
-                            if self.board[r][c][0] != self.board[end_row][end_col][0]:
-                                moves.append(
-                                    Move((r, c), (end_row, end_col), self.board))
-                            break
-                    else:
-                        break
+    def get_bishop_moves(self, r, c, moves):
+        self.get_slider_moves(r, c, moves, BISHOP_DIRECTIONS, BISHOP_RAYS[r*8 + c])
 
     def get_queen_moves(self, r, c, moves):
-        piece_pinned, pin_direction = self.is_piece_pinned(r, c)
-        directions = ((1, 0), (-1, 0), (0, 1), (0, -1),
-                      (1, 1), (-1, 1), (1, -1), (-1, -1))
-
-        for d in directions:
-            if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]):
-                for i in range(1, 8):
-                    end_row = r + i*d[0]
-                    end_col = c + i*d[1]
-                    if 0 <= end_row < 8 and 0 <= end_col < 8:
-                        if self.board[end_row][end_col] == '--':
-                            moves.append(
-                                Move((r, c), (end_row, end_col), self.board))
-                        else:
-                            if self.board[r][c][0] != self.board[end_row][end_col][0]:
-                                moves.append(
-                                    Move((r, c), (end_row, end_col), self.board))
-                            break
-                    else:
-                        break
+        self.get_slider_moves(r, c, moves, QUEEN_DIRECTIONS, QUEEN_RAYS[r*8 + c])
 
     def get_knight_moves(self, r, c, moves):
         piece_pinned, pin_direction = self.is_piece_pinned(r, c)
         if not piece_pinned:
-            for i, j in self.knight_moves:
-                if r+i < len(self.board) and r+i > -1:
-                    if c+j < len(self.board[r+i]) and c+j > -1:
-                        if self.board[r+i][c+j][0] != self.board[r][c][0]:
-                            moves.append(Move((r, c), (r+i, c+j), self.board))
+            ally_color = self.board[r][c][0]
+            for end_sq in KNIGHT_TARGETS[r*8 + c]:
+                if self.board[end_sq[0]][end_sq[1]][0] != ally_color:
+                    moves.append(Move((r, c), end_sq, self.board))
 
     def get_king_moves(self, r, c, moves):
         ally_color = self.board[r][c][0]
-        for i, j in self.king_moves:
-            if -1 < r+i < len(self.board):
-                if c+j < len(self.board[r+i]) and c+j > -1:
-                    if self.board[r+i][c+j][0] != self.board[r][c][0]:
-                        if ally_color == 'w':
-                            self.white_king_loc = (r+i, c+j)
-                        elif ally_color == 'b':
-                            self.black_king_loc = (r+i, c+j)
-
-                        is_in_check, pins, checks = self.check_pins_checks()
-                        if not is_in_check:
-                            moves.append(Move((r, c), (r+i, c+j), self.board))
-
-                        if ally_color == 'w':
-                            self.white_king_loc = (r, c)
-                        elif ally_color == 'b':
-                            self.black_king_loc = (r, c)
+        for end_sq in KING_NEIGHBOURS[r*8 + c]:
+            if self.board[end_sq[0]][end_sq[1]][0] != ally_color:
+                if ally_color == 'w':
+                    self.white_king_loc = end_sq
+                elif ally_color == 'b':
+                    self.black_king_loc = end_sq
+
+                is_in_check, pins, checks = self.check_pins_checks()
+                if not is_in_check:
+                    moves.append(Move((r, c), end_sq, self.board))
+
+                if ally_color == 'w':
+                    self.white_king_loc = (r, c)
+                elif ally_color == 'b':
+                    self.black_king_loc = (r, c)
 
         self.get_castle_moves(r, c, moves, ally_color)
 
@@ -423,9 +700,9 @@ class GameState():
         if self.is_in_check:
             return
 
-        if (self.white_to_move and self.current_castle_rights.wks) or ((not self.white_to_move) and self.current_castle_rights.bks):
+        if self.castle_rights & (CASTLE_WKS if self.white_to_move else CASTLE_BKS):
             self.get_kingside_castle(r, c, moves, ally_color)
-        if (self.white_to_move and self.current_castle_rights.wqs) or ((not self.white_to_move) and self.current_castle_rights.bqs):
+        if self.castle_rights & (CASTLE_WQS if self.white_to_move else CASTLE_BQS):
             self.get_queenside_castle(r, c, moves, ally_color)
 
     def get_kingside_castle(self, r, c, moves, ally_color):
@@ -440,6 +717,16 @@ class GameState():
                 moves.append(
                     Move((r, c), (r, c-2), self.board, is_castle=True))
 
+    # piece letter -> move generator, shared by every GameState
+    MOVE_FUNCTIONS = {
+        'p': get_pawn_moves,
+        'k': get_king_moves,
+        'r': get_rook_moves,
+        'n': get_knight_moves,
+        'b': get_bishop_moves,
+        'q': get_queen_moves,
+    }
+
     def get_all_possible_moves(self):
         moves = []
         for r in range(len(self.board)):
@@ -447,7 +734,7 @@ class GameState():
                 turn = self.board[r][c][0]
                 if (turn == 'w' and self.white_to_move) or (turn == 'b' and (not self.white_to_move)):
                     piece = self.board[r][c][1]
-                    self.move_function[piece](r, c, moves)
+                    self.MOVE_FUNCTIONS[piece](self, r, c, moves)
         return moves
 
     def check_pins_checks(self):
@@ -465,42 +752,34 @@ class GameState():
             start_row = self.black_king_loc[0]
             start_col = self.black_king_loc[1]
 
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1))
-
-        for j in range(len(directions)):
-            d = directions[j]
+        start_sq = start_row*8 + start_col
+        for j, ray in enumerate(ATTACK_RAYS[start_sq]):
+            d = ATTACK_DIRECTIONS[j]
             possible_pin = ()
-            for i in range(1, 8):
-                end_row = start_row + i*d[0]
-                end_col = start_col + i*d[1]
-                if -1 < end_row < 8 and -1 < end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color and end_piece[1] != 'k':
+            for i, (end_row, end_col) in enumerate(ray, 1):
+                end_piece = self.board[end_row][end_col]
+                if end_piece[0] == ally_color and end_piece[1] != 'k':
+                    if possible_pin == ():
+                        possible_pin = (end_row, end_col, d[0], d[1])
+                    else:
+                        break
+                if end_piece[0] == enemy_color:
+                    type = end_piece[1]
+                    if type == 'q' or (0 <= j <= 3 and type == 'r') or (4 <= j <= 7 and type == 'b') or (i == 1 and type == 'k') or (i == 1 and type == 'p' and ((enemy_color == 'w' and 6 <= j <= 7) or (enemy_color == 'b' and 4 <= j <= 5))):
                         if possible_pin == ():
-                            possible_pin = (end_row, end_col, d[0], d[1])
-                        else:
-                            break
-                    if end_piece[0] == enemy_color:
-                        type = end_piece[1]
-                        if type == 'q' or (0 <= j <= 3 and type == 'r') or (4 <= j <= 7 and type == 'b') or (i == 1 and type == 'k') or (i == 1 and type == 'p' and ((enemy_color == 'w' and 6 <= j <= 7) or (enemy_color == 'b' and 4 <= j <= 5))):
-                            if possible_pin == ():
-                                is_in_check = True
-                                checks.append((end_row, end_col, d[0], d[1]))
-                            else:
-                                pins.append(possible_pin)
-                                break
+                            is_in_check = True
+                            checks.append((end_row, end_col, d[0], d[1]))
                         else:
+                            pins.append(possible_pin)
                             break
+                    else:
+                        break
 
-        for m in self.knight_moves:
-            end_row = start_row + m[0]
-            end_col = start_col + m[1]
-            if -1 < end_row < len(self.board) and -1 < end_col < len(self.board[end_row]):
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == 'n':
-                    is_in_check = True
-                    checks.append((end_row, end_col, m[0], m[1]))
+        for end_row, end_col in KNIGHT_TARGETS[start_sq]:
+            end_piece = self.board[end_row][end_col]
+            if end_piece[0] == enemy_color and end_piece[1] == 'n':
+                is_in_check = True
+                checks.append((end_row, end_col, end_row - start_row, end_col - start_col))
 
         return is_in_check, pins, checks
 
@@ -522,20 +801,15 @@ class GameState():
                 check_row = check[0]
                 check_col = check[1]
                 piece_check = self.board[check_row][check_col]
-                valid_squares = []
 
-                if piece_check[1] == 'n':
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_sq = (
-                            king_row + i*check[2], king_col + i*check[3])
-                        valid_squares.append(valid_sq)
-                        if valid_sq[0] == check_row and valid_sq[1] == check_col:
-                            break
+                # capture the checker or, unless it is a knight, block
+                # anywhere between it and the king
+                valid_squares = 1 << (check_row*8 + check_col)
+                if piece_check[1] != 'n':
+                    valid_squares |= BETWEEN[king_row*8 + king_col][check_row*8 + check_col]
                 for i in range(len(moves)-1, -1, -1):
                     if moves[i].piece_moved[1] != 'k':
-                        if not (moves[i].end_row, moves[i].end_col) in valid_squares:
+                        if not valid_squares >> (moves[i].end_row*8 + moves[i].end_col) & 1:
                             moves.remove(moves[i])
 
             else:
@@ -566,30 +840,65 @@ class GameState():
         ally_color = 'w' if self.white_to_move else 'b'
         enemy_color = 'b' if self.white_to_move else 'w'
 
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1))
-
-        for j in range(len(directions)):
-            d = directions[j]
-            for i in range(1, 8):
-                end_row = start_row + i*d[0]
-                end_col = start_col + i*d[1]
-                if -1 < end_row < 8 and -1 < end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color:
-                        break
-                    if end_piece[0] == enemy_color:
-                        type = end_piece[1]
-                        if type == 'q' or (0 <= j <= 3 and type == 'r') or (4 <= j <= 7 and type == 'b') or (i == 1 and type == 'k') or (i == 1 and type == 'p' and ((enemy_color == 'w' and 6 <= j <= 7) or (enemy_color == 'b' and 4 <= j <= 5))):
-                            is_in_check = True
-                        break
-
-        for m in self.knight_moves:
-            end_row = start_row + m[0]
-            end_col = start_col + m[1]
-            if -1 < end_row < len(self.board) and -1 < end_col < len(self.board[end_row]):
+        start_sq = start_row*8 + start_col
+        for j, ray in enumerate(ATTACK_RAYS[start_sq]):
+            for i, (end_row, end_col) in enumerate(ray, 1):
                 end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == 'n':
-                    is_in_check = True
+                if end_piece[0] == ally_color:
+                    break
+                if end_piece[0] == enemy_color:
+                    type = end_piece[1]
+                    if type == 'q' or (0 <= j <= 3 and type == 'r') or (4 <= j <= 7 and type == 'b') or (i == 1 and type == 'k') or (i == 1 and type == 'p' and ((enemy_color == 'w' and 6 <= j <= 7) or (enemy_color == 'b' and 4 <= j <= 5))):
+                        is_in_check = True
+                    break
+
+        for end_row, end_col in KNIGHT_TARGETS[start_sq]:
+            end_piece = self.board[end_row][end_col]
+            if end_piece[0] == enemy_color and end_piece[1] == 'n':
+                is_in_check = True
 
         return is_in_check
+
+
+PROMOTION_CODES = ' qrbn'
+
+
+def encode_move(move: Move) -> int:
+    # start square | end square << 6 | promotion piece << 12, fits in 16 bits
+    promotion = PROMOTION_CODES.index(move.promotion_choice) if move.is_promotion else 0
+    return (move.start_row*8 + move.start_col) | ((move.end_row*8 + move.end_col) << 6) | (promotion << 12)
+
+
+def decode_move(code, valid_moves):
+    for m in valid_moves:
+        if encode_move(m) == code:
+            return m
+    return None
+
+
+def positions_view(buffer) -> memoryview:
+    # accepts any contiguous buffer (bytes, bytearray, mmap, uint8 numpy
+    # array of shape (n, POSITION_SIZE)) without copying it
+    view = memoryview(buffer).cast('B')
+    if len(view) % POSITION_SIZE != 0:
+        raise ValueError("buffer size {} is not a multiple of {}".format(
+            len(view), POSITION_SIZE))
+    return view
+
+
+def encode_positions(states, buffer=None) -> memoryview:
+    states = list(states)
+    if buffer is None:
+        buffer = bytearray(len(states) * POSITION_SIZE)
+    view = positions_view(buffer)
+    if len(view) < len(states) * POSITION_SIZE:
+        raise ValueError("buffer too small for {} positions".format(len(states)))
+    for i, gs in enumerate(states):
+        gs.pack_into(view, i * POSITION_SIZE)
+    return view
+
+
+def decode_positions(buffer):
+    view = positions_view(buffer)
+    for offset in range(0, len(view), POSITION_SIZE):
+        yield GameState.unpack_from(view, offset)
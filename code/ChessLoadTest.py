@@ -0,0 +1,108 @@
+'''
+Load-test client for ChessServer.
+
+Plays many engine-vs-engine games at once, one connection per game, and
+reports move latency percentiles and throughput.
+
+    python ChessLoadTest.py --port 8765 --games 64 --moves 20 --time 0.2
+'''
+import argparse
+import asyncio
+import json
+import time
+
+
+class Client():
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, host, port, unix_path=None):
+        if unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, cmd, **params):
+        self.next_id += 1
+        request_id = self.next_id
+        self.writer.write(json.dumps({"id": request_id, "cmd": cmd, **params}).encode() + b"\n")
+        await self.writer.drain()
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            reply = json.loads(line)
+            # skip streamed progress lines
+            if reply.get("id") == request_id and "ok" in reply:
+                return reply
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered)-1, max(0, round(p/100*(len(ordered)-1))))
+    return ordered[k]
+
+
+async def play_game(args, latencies, counters):
+    client = await Client.connect(args.host, args.port, args.unix)
+    try:
+        session = (await client.request("new"))["session"]
+        played = 0
+        # a move's latency includes any busy replies and backoff before it
+        start = time.perf_counter()
+        while played < args.moves:
+            reply = await client.request("search", session=session, time=args.time,
+                                         depth=args.depth, play=True)
+            if not reply["ok"]:
+                if reply["error"] == "busy":
+                    # back off and retry the same move; refusals are not moves
+                    counters["busy"] += 1
+                    await asyncio.sleep(args.time)
+                    continue
+                break
+            latencies.append(time.perf_counter() - start)
+            played += 1
+            start = time.perf_counter()
+            if reply.get("checkmate") or reply.get("stalemate"):
+                break
+        await client.request("close", session=session)
+    finally:
+        await client.close()
+
+
+async def run(args):
+    latencies = []
+    counters = {"busy": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*(play_game(args, latencies, counters) for _ in range(args.games)))
+    elapsed = time.perf_counter() - start
+
+    print("games      {}".format(args.games))
+    print("moves      {}".format(len(latencies)))
+    print("busy       {}".format(counters["busy"]))
+    print("elapsed    {:.2f} s".format(elapsed))
+    print("throughput {:.1f} moves/s".format(len(latencies)/elapsed if elapsed > 0 else 0.0))
+    print("p50        {:.1f} ms".format(percentile(latencies, 50)*1000))
+    print("p99        {:.1f} ms".format(percentile(latencies, 99)*1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="load test for ChessServer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--games", type=int, default=32, help="concurrent games")
+    parser.add_argument("--moves", type=int, default=20, help="engine moves per game")
+    parser.add_argument("--time", type=float, default=0.2, help="search time per move in seconds")
+    parser.add_argument("--depth", type=int, default=4, help="maximum search depth per move")
+    asyncio.run(run(parser.parse_args()))
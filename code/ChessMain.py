@@ -1,13 +1,13 @@
 import pygame as p
 from pygame.surface import Surface
-from sqlalchemy import true
 from ChessEngine import GameState, Move
-from ChessAI import DEPTH, findMinMaxDepth2Move, findBestMoveMinMax
+from ChessAI import DEPTH, findMinMaxDepth2Move, findBestMoveMinMax, findBookMove
 
 WIDTH = HEIGHT = 512
 DIMENSION = 8
 SQ_SIZE = WIDTH//DIMENSION
 MAX_FPS = 15
+BOOK_PATH = None  # e.g. "book.idx" built with ChessBook.py
 IMAGES = {}
 colors = [p.Color("#EBCD7D"), p.Color("#B88B4A")]  # light, dark
 
@@ -117,6 +117,10 @@ if __name__ == '__main__':
     game_over = False
     playerOne = False  # if human is the player true, if AI is the player false
     playerTwo = False  # if human is the player true, if AI is the player false
+    book = None
+    if BOOK_PATH is not None:
+        from ChessBook import OpeningBook
+        book = OpeningBook(BOOK_PATH)
 
     while(running):
         humanTurn = (gs.white_to_move and playerOne) or (
@@ -180,10 +184,12 @@ if __name__ == '__main__':
         # AI move logic
         if not game_over and not humanTurn:
             # ai_move = findMinMaxDepth2Move(gs, valid_moves)
-            ai_move = findBestMoveMinMax(gs, valid_moves)
+            ai_move = findBookMove(gs, valid_moves, book)
+            if ai_move is None:
+                ai_move = findBestMoveMinMax(gs, valid_moves)
             gs.make_move(ai_move)
-            move_made = true
-            animate = true
+            move_made = True
+            animate = True
 
         if move_made:
             if not undone:
@@ -0,0 +1,216 @@
+'''
+Forced-mate solver using depth-first proof-number search (df-PN).
+
+The side to move at the root is the attacker. Proof and disproof numbers
+are kept in a transposition table keyed by position hash, so transpositions
+are only solved once. Unlike the fixed-depth Searcher the solver goes
+deepest where the defender has the fewest replies, which is what makes
+long forcing mates cheap to find.
+
+    result = solveMate(gs, maxMoves=5, maxNodes=200000)
+    if result.proven:
+        print(result.distance, [m.get_chess_notation() for m in result.line])
+
+The search looks for mates of at most maxMoves attacker moves. Once a mate
+is proven the limit is lowered below its distance and the position solved
+again, until that fails, so the line returned is a shortest mate. If the
+node budget runs out first, the shortest mate proven so far is returned.
+Repetitions count as "no mate". A disproof is stored with the number of
+plies it was searched to and is only reused where no more plies remain
+than that, so the table carries over between limits.
+'''
+from ChessEngine import GameState
+
+INF = 10**9
+MAX_MOVES = 8
+MAX_TT_ENTRIES = 1 << 21
+
+
+class MateBudgetExceeded(Exception):
+    pass
+
+
+class MateResult():
+    def __init__(self, proven, disproven, line, nodes) -> None:
+        self.proven = proven
+        self.disproven = disproven
+        self.line = line
+        self.nodes = nodes
+
+    @property
+    def distance(self):
+        # mate in N moves of the attacker, None when no mate was proven
+        return (len(self.line)+1)//2 if self.proven else None
+
+
+class MateSolver():
+    def __init__(self, maxMoves=MAX_MOVES, maxNodes=200000, maxEntries=MAX_TT_ENTRIES) -> None:
+        self.maxNodes = maxNodes
+        self.maxEntries = maxEntries
+        self.maxMoves = maxMoves
+        self.maxPly = 2*maxMoves - 1
+        # hash -> (proof number, disproof number, aux) where aux is the plies
+        # to mate once proven, or the plies searched once disproven
+        self.tt = {}
+        self.nodes = 0
+        self.path = set()
+        self.attackerWhite = True
+
+    def lookup(self, key, ply, orNode):
+        # orNode is the kind of the position being looked up
+        if key in self.path:
+            return INF, 0, INF
+        entry = self.tt.get(key)
+        if entry is not None and entry[0] == 0 and entry[2] <= self.maxPly - ply:
+            return entry
+        if orNode and ply >= self.maxPly:
+            # the attacker has no moves left to give mate with
+            return INF, 0, INF
+        if entry is None or entry[0] == 0 or (entry[1] == 0 and entry[2] < self.maxPly - ply):
+            return 1, 1, 0
+        return entry
+
+    def store(self, key, pn, dn, aux):
+        if key not in self.tt and len(self.tt) >= self.maxEntries:
+            raise MateBudgetExceeded()
+        self.tt[key] = (pn, dn, aux)
+
+    def childKeys(self, gs: GameState, moves):
+        keys = []
+        for m in moves:
+            gs.make_move(m)
+            keys.append(gs.hash)
+            gs.undo_move()
+        return keys
+
+    def mid(self, gs: GameState, thpn, thdn, ply):
+        self.nodes += 1
+        if self.nodes > self.maxNodes:
+            raise MateBudgetExceeded()
+
+        key = gs.hash
+        moves = gs.get_valid_moves()
+        orNode = gs.white_to_move == self.attackerWhite
+        if len(moves) == 0:
+            if gs.checkmate and not orNode:
+                self.store(key, 0, INF, 0)
+            else:
+                # attacker mated or stalemate: no mate here, at any depth
+                self.store(key, INF, 0, INF)
+            return
+        if not orNode and ply >= self.maxPly:
+            # the defender has a move and the attacker has none left
+            self.store(key, INF, 0, 0)
+            return
+
+        keys = self.childKeys(gs, moves)
+        self.path.add(key)
+        while True:
+            values = [self.lookup(k, ply+1, not orNode) for k in keys]
+            if orNode:
+                pn = min(v[0] for v in values)
+                dn = min(INF, sum(v[1] for v in values))
+            else:
+                pn = min(INF, sum(v[0] for v in values))
+                dn = min(v[1] for v in values)
+            if pn >= thpn or dn >= thdn or pn == 0 or dn == 0:
+                break
+
+            # pick the most proving child and the threshold that keeps it best
+            own = 0 if orNode else 1
+            best = 0
+            second = INF
+            for i in range(1, len(values)):
+                if values[i][own] < values[best][own]:
+                    second = values[best][own]
+                    best = i
+                elif values[i][own] < second:
+                    second = values[i][own]
+            childPn, childDn, _ = values[best]
+            if orNode:
+                childThpn = min(thpn, second+1)
+                childThdn = min(INF, thdn - dn + childDn)
+            else:
+                childThpn = min(INF, thpn - pn + childPn)
+                childThdn = min(thdn, second+1)
+
+            gs.make_move(moves[best])
+            self.mid(gs, childThpn, childThdn, ply+1)
+            gs.undo_move()
+        self.path.discard(key)
+
+        aux = 0
+        if pn == 0:
+            proven = [v[2] for v in values if v[0] == 0]
+            # the attacker takes the quickest proven mate, the defender the slowest
+            aux = 1 + (min(proven) if orNode else max(proven))
+        elif dn == 0:
+            aux = self.maxPly - ply
+        self.store(key, pn, dn, aux)
+
+    def mateLine(self, gs: GameState):
+        line = []
+        made = 0
+        while len(line) < self.maxPly:
+            moves = gs.get_valid_moves()
+            if len(moves) == 0:
+                break
+            orNode = gs.white_to_move == self.attackerWhite
+            best = None
+            bestDist = None
+            for m, k in zip(moves, self.childKeys(gs, moves)):
+                entry = self.tt.get(k)
+                if entry is None or entry[0] != 0:
+                    continue
+                if bestDist is None or (entry[2] < bestDist if orNode else entry[2] > bestDist):
+                    best = m
+                    bestDist = entry[2]
+            if best is None:
+                break
+            line.append(best)
+            gs.make_move(best)
+            made += 1
+        for _ in range(made):
+            gs.undo_move()
+        return line
+
+    def solveWithin(self, gs: GameState, maxMoves):
+        # (pn, dn, aux) of the root for mates of at most maxMoves moves; the
+        # node budget is shared with earlier calls of the same solve
+        self.maxPly = 2*maxMoves - 1
+        self.path = set()
+        historyLength = len(gs.move_log)
+        try:
+            self.mid(gs, INF, INF, 0)
+        except MateBudgetExceeded:
+            while len(gs.move_log) > historyLength:
+                gs.undo_move()
+            self.path = set()
+        entry = self.tt.get(gs.hash, (1, 1, 0))
+        if entry[0] == 0 and entry[2] > self.maxPly:
+            # a proof left over from a longer limit does not count here
+            return 1, 1, 0
+        return entry
+
+    def solve(self, gs: GameState) -> MateResult:
+        self.nodes = 0
+        self.attackerWhite = gs.white_to_move
+        line = []
+        disproven = False
+        limit = self.maxMoves
+        while limit > 0:
+            entry = self.solveWithin(gs, limit)
+            # leave the game-over flags as they are for the root position
+            gs.get_valid_moves()
+            if entry[0] != 0:
+                disproven = entry[1] == 0 and not line
+                break
+            line = self.mateLine(gs)
+            # entry[2] is the proof's length in plies
+            limit = (entry[2]+1)//2 - 1
+        self.maxPly = 2*self.maxMoves - 1
+        return MateResult(len(line) > 0, disproven, line, self.nodes)
+
+
+def solveMate(gs: GameState, maxMoves=MAX_MOVES, maxNodes=200000) -> MateResult:
+    return MateSolver(maxMoves, maxNodes).solve(gs)
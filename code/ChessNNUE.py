@@ -0,0 +1,197 @@
+'''
+Efficiently updatable neural network (NNUE style) evaluator.
+
+Input features are HalfKP-like: for each side's point of view, every
+non-king piece is one feature indexed by (own king square, piece, square),
+with black's view mirrored vertically. The first layer is kept as one
+accumulator per side. GameState.make_move / undo_move call push / pop, which
+add or subtract only the weight rows of the pieces that moved, so only the
+small dense layers run when a position is evaluated.
+
+    evaluator = NNUEEvaluator(NNUEWeights.load("net.nnue"))
+    evaluator.attach(gs)
+    searcher = ChessAI.Searcher(evaluate=evaluator.scoreBoard)
+
+Weights file layout (little endian): magic b"NNUE", uint32 version, uint32
+sizes hidden, l1, l2, then float32 arrays ft_w (FEATURES x hidden), ft_b,
+l1_w (2*hidden x l1), l1_b, l2_w (l1 x l2), l2_b, out_w (l2), out_b (1).
+'''
+import struct
+
+import numpy as np
+
+from ChessEngine import GameState, Move, PIECE_TO_CODE
+from ChessAI import CHECKMATE, STALEMATE
+
+MAGIC = b"NNUE"
+VERSION = 1
+PIECE_FEATURES = 10  # own p n b r q, enemy p n b r q
+FEATURES = 64 * PIECE_FEATURES * 64
+WHITE = 0
+BLACK = 1
+STACK_GROWTH = 128
+
+
+class NNUEWeights():
+    def __init__(self, ft_w, ft_b, l1_w, l1_b, l2_w, l2_b, out_w, out_b) -> None:
+        self.ft_w = ft_w
+        self.ft_b = ft_b
+        self.l1_w = l1_w
+        self.l1_b = l1_b
+        self.l2_w = l2_w
+        self.l2_b = l2_b
+        self.out_w = out_w
+        self.out_b = out_b
+
+    @property
+    def hidden(self):
+        return self.ft_b.shape[0]
+
+    def arrays(self):
+        return (self.ft_w, self.ft_b, self.l1_w, self.l1_b,
+                self.l2_w, self.l2_b, self.out_w, self.out_b)
+
+    @classmethod
+    def shapes(cls, hidden, l1, l2):
+        return ((FEATURES, hidden), (hidden,), (2*hidden, l1), (l1,),
+                (l1, l2), (l2,), (l2,), (1,))
+
+    @classmethod
+    def random(cls, hidden=128, l1=32, l2=32, seed=0) -> 'NNUEWeights':
+        rng = np.random.default_rng(seed)
+        return cls(*(rng.normal(0, 0.05, shape).astype(np.float32)
+                     for shape in cls.shapes(hidden, l1, l2)))
+
+    @classmethod
+    def load(cls, path) -> 'NNUEWeights':
+        with open(path, "rb") as f:
+            magic, version, hidden, l1, l2 = struct.unpack("<4s4I", f.read(20))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("{} is not a version {} NNUE file".format(path, VERSION))
+            arrays = []
+            for shape in cls.shapes(hidden, l1, l2):
+                count = int(np.prod(shape))
+                data = np.fromfile(f, dtype="<f4", count=count)
+                if data.size != count:
+                    raise ValueError("{} is truncated".format(path))
+                arrays.append(data.astype(np.float32).reshape(shape))
+        return cls(*arrays)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4s4I", MAGIC, VERSION, self.hidden,
+                                self.l1_b.shape[0], self.l2_b.shape[0]))
+            for a in self.arrays():
+                a.astype("<f4").tofile(f)
+
+
+def feature_index(perspective, king_sq, code, sq):
+    # code is a PIECE_CODES index other than a king
+    if perspective == BLACK:
+        king_sq ^= 56
+        sq ^= 56
+    piece_color = WHITE if code <= 6 else BLACK
+    piece = (code - 1) % 6 + (0 if piece_color == perspective else 5)
+    return (king_sq * PIECE_FEATURES + piece) * 64 + sq
+
+
+class NNUEEvaluator():
+    def __init__(self, weights: NNUEWeights) -> None:
+        self.weights = weights
+        self.stack = np.zeros((STACK_GROWTH, 2, weights.hidden), dtype=np.float32)
+        self.top = 0
+
+    def attach(self, gs: GameState):
+        # one evaluator follows one GameState; moves made afterwards keep
+        # the accumulators in sync
+        gs.nnue = self
+        self.top = 0
+        self.refresh(gs, WHITE, self.stack[0, WHITE])
+        self.refresh(gs, BLACK, self.stack[0, BLACK])
+
+    def detach(self, gs: GameState):
+        if gs.nnue is self:
+            gs.nnue = None
+
+    def king_square(self, gs: GameState, perspective):
+        r, c = gs.white_king_loc if perspective == WHITE else gs.black_king_loc
+        return r*8 + c
+
+    def refresh(self, gs: GameState, perspective, acc):
+        king_sq = self.king_square(gs, perspective)
+        features = []
+        for r in range(8):
+            for c in range(8):
+                code = PIECE_TO_CODE[gs.board[r][c]]
+                if code and code != 6 and code != 12:
+                    features.append(feature_index(perspective, king_sq, code, r*8 + c))
+        np.sum(self.weights.ft_w[features], axis=0, out=acc)
+        acc += self.weights.ft_b
+
+    def push(self, gs: GameState, move: Move):
+        # called by make_move after the board has been updated
+        if self.top + 1 == len(self.stack):
+            self.stack = np.concatenate([self.stack, np.zeros_like(self.stack[:STACK_GROWTH])])
+        prev = self.stack[self.top]
+        self.top += 1
+        accs = self.stack[self.top]
+
+        color = move.piece_moved[0]
+        removed = []
+        added = []
+        if move.piece_moved[1] != 'k':
+            removed.append((PIECE_TO_CODE[move.piece_moved], move.start_row*8 + move.start_col))
+            placed = color + move.promotion_choice if move.is_promotion else move.piece_moved
+            added.append((PIECE_TO_CODE[placed], move.end_row*8 + move.end_col))
+        elif move.is_castle:
+            rook = PIECE_TO_CODE[color + 'r']
+            if move.end_col - move.start_col == 2:
+                removed.append((rook, move.end_row*8 + 7))
+                added.append((rook, move.end_row*8 + move.end_col - 1))
+            else:
+                removed.append((rook, move.end_row*8))
+                added.append((rook, move.end_row*8 + move.end_col + 1))
+        if move.piece_captured != '--':
+            captured_sq = (move.start_row if move.is_enpassant else move.end_row)*8 + move.end_col
+            removed.append((PIECE_TO_CODE[move.piece_captured], captured_sq))
+
+        ft_w = self.weights.ft_w
+        for perspective in (WHITE, BLACK):
+            acc = accs[perspective]
+            if move.piece_moved[1] == 'k' and (perspective == WHITE) == (color == 'w'):
+                # a king move changes every feature of that side's view
+                self.refresh(gs, perspective, acc)
+                continue
+            acc[:] = prev[perspective]
+            king_sq = self.king_square(gs, perspective)
+            for code, sq in removed:
+                acc -= ft_w[feature_index(perspective, king_sq, code, sq)]
+            for code, sq in added:
+                acc += ft_w[feature_index(perspective, king_sq, code, sq)]
+
+    def pop(self):
+        self.top -= 1
+
+    def evaluate(self, gs: GameState):
+        # network output from the side to move's point of view, in pawns
+        if gs.nnue is self:
+            accs = self.stack[self.top]
+        else:
+            accs = np.empty((2, self.weights.hidden), dtype=np.float32)
+            self.refresh(gs, WHITE, accs[WHITE])
+            self.refresh(gs, BLACK, accs[BLACK])
+        w = self.weights
+        us, them = (WHITE, BLACK) if gs.white_to_move else (BLACK, WHITE)
+        x = np.clip(np.concatenate((accs[us], accs[them])), 0.0, 1.0)
+        x = np.clip(x @ w.l1_w + w.l1_b, 0.0, 1.0)
+        x = np.clip(x @ w.l2_w + w.l2_b, 0.0, 1.0)
+        return float(x @ w.out_w + w.out_b[0])
+
+    def scoreBoard(self, gs: GameState):
+        # drop-in replacement for ChessAI.scoreBoard (positive is good for white)
+        if gs.checkmate:
+            return -CHECKMATE if gs.white_to_move else CHECKMATE
+        if gs.stalemate:
+            return -STALEMATE if gs.white_to_move else STALEMATE
+        score = self.evaluate(gs)
+        return score if gs.white_to_move else -score
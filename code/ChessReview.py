@@ -0,0 +1,199 @@
+'''
+Batch game review: scores every position of finished games and flags
+inaccuracies, mistakes and blunders.
+
+Positions are split into contiguous chunks and spread over a process pool.
+Each worker walks its chunk backwards with one Searcher, so the
+transposition table filled for a position orders the moves of the search
+of the position before it, whose tree contains it. The searcher runs with
+exactDepth, so table entries only cut off at the depth they were searched
+to, and a position gets the same scores whatever chunk or worker it lands
+in. The played move is re-searched to the same depth as the best move, so
+the loss compares like with like.
+
+    reviews = review_games([["e4", "e5", "Qh5", "Nc6", "Bc4", "Nf6", "Qxf7#"]], depth=3)
+
+    python ChessReview.py games.pgn --depth 3 --workers 8
+'''
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ChessEngine import GameState, Move
+from ChessBook import read_games
+import ChessAI
+
+INACCURACY = 0.5
+MISTAKE = 1.0
+BLUNDER = 2.0
+# mate scores are clamped to this many pawns when computing losses
+SCORE_CAP = 20.0
+CHUNKS_PER_WORKER = 4
+
+_worker_searcher = None
+
+
+class MoveReview():
+    def __init__(self, ply, move, best_move, best_score, played_score, pv) -> None:
+        self.ply = ply
+        self.move = move
+        self.best_move = best_move
+        # scores are in pawns from the point of view of the side that moved
+        self.best_score = best_score
+        self.played_score = played_score
+        self.pv = pv
+
+    @property
+    def loss(self):
+        best = max(-SCORE_CAP, min(SCORE_CAP, self.best_score))
+        played = max(-SCORE_CAP, min(SCORE_CAP, self.played_score))
+        return max(0.0, best - played)
+
+    @property
+    def annotation(self):
+        if self.move == self.best_move:
+            return ""
+        loss = self.loss
+        if loss >= BLUNDER:
+            return "??"
+        if loss >= MISTAKE:
+            return "?"
+        if loss >= INACCURACY:
+            return "?!"
+        return ""
+
+    def to_dict(self):
+        return {
+            "ply": self.ply,
+            "move": self.move,
+            "best_move": self.best_move,
+            "best_score": self.best_score,
+            "played_score": self.played_score,
+            "loss": round(self.loss, 2),
+            "annotation": self.annotation,
+            "pv": self.pv,
+        }
+
+
+def analyse_positions(task):
+    # runs inside a pool worker: (key, [(index, position bytes, played move)],
+    # depth, time limit); returns (index, best move, best score, played score, pv)
+    key, positions, depth, time_limit = task
+    global _worker_searcher
+    if _worker_searcher is None:
+        _worker_searcher = ChessAI.Searcher(evaluate=ChessAI.Evaluator().scoreBoard, exactDepth=True)
+    searcher = _worker_searcher
+    results = []
+    for index, position, played in reversed(positions):
+        gs = GameState.from_bytes(position)
+        valid_moves = gs.get_valid_moves()
+        if len(valid_moves) == 0 or played is None:
+            results.append((index, None, None, None, []))
+            continue
+        result = searcher.search(gs, valid_moves, depth, time_limit)
+        best_move = result.move.get_chess_notation()
+        played_score = result.score
+        if played != best_move:
+            gs.make_move(gs.parse_move(played, valid_moves))
+            played_score = -searcher.negaMax(gs, gs.get_valid_moves(), max(0, result.depth-1),
+                                            -ChessAI.CHECKMATE-1, ChessAI.CHECKMATE+1, 1)
+            gs.undo_move()
+        results.append((index, best_move, result.score, played_score,
+                        [m.get_chess_notation() for m in result.pv]))
+    return key, results
+
+
+def replay(moves, fen=None):
+    # packed positions before every move and after the last one, plus the
+    # moves in coordinate notation; stops at the first illegal move
+    gs = GameState.from_fen(fen) if fen else GameState()
+    positions = [gs.to_bytes()]
+    played = []
+    for move in moves:
+        if isinstance(move, Move):
+            move = move.get_chess_notation()
+        try:
+            m = gs.parse_move(move)
+        except ValueError:
+            break
+        gs.make_move(m)
+        played.append(m.get_chess_notation())
+        positions.append(gs.to_bytes())
+    return positions, played
+
+
+def review_games(games, depth=3, time_limit=None, workers=None, fen=None):
+    '''
+    Review several games at once. Each game is a list of moves (SAN or
+    coordinate strings, or Move objects such as a GameState.move_log).
+    Returns one list of MoveReview per game.
+    '''
+    workers = workers or os.cpu_count() or 1
+    replays = [replay(moves, fen) for moves in games]
+    total = sum(len(played) for _, played in replays)
+    chunk_size = max(1, -(-total // (workers * CHUNKS_PER_WORKER)))
+
+    tasks = []
+    for g, (positions, played) in enumerate(replays):
+        # the final position has no played move and needs no search
+        entries = [(i, positions[i], played[i]) for i in range(len(played))]
+        for start in range(0, len(entries), chunk_size):
+            tasks.append(((g, start), entries[start:start+chunk_size], depth, time_limit))
+
+    analysis = [[None] * len(played) for _, played in replays]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (g, _), results in pool.map(analyse_positions, tasks):
+            for index, best_move, best_score, played_score, pv in results:
+                analysis[g][index] = (best_move, best_score, played_score, pv)
+
+    reviews = []
+    for g, (_, played) in enumerate(replays):
+        review = [MoveReview(ply, move, *analysis[g][ply]) for ply, move in enumerate(played)]
+        reviews.append(review)
+    return reviews
+
+
+def review_game(moves, depth=3, time_limit=None, workers=None, fen=None):
+    return review_games([moves], depth, time_limit, workers, fen)[0]
+
+
+def format_review(review):
+    lines = []
+    for r in review:
+        number = "{}.".format(r.ply//2 + 1) if r.ply % 2 == 0 else "{}...".format(r.ply//2 + 1)
+        text = "{:<7}{}{}".format(number, r.move, r.annotation)
+        if r.annotation:
+            text += "  ({:+.2f}, best {} {:+.2f})".format(-r.loss, r.best_move, r.best_score)
+        lines.append(text)
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="annotate finished games with engine evaluations")
+    parser.add_argument("games", help="PGN file or one coordinate-notation game per line")
+    parser.add_argument("--depth", type=int, default=3, help="search depth per position")
+    parser.add_argument("--time", type=float, default=None, help="search time per position in seconds")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: cpu count)")
+    parser.add_argument("--json", help="write the reviews to this file")
+    args = parser.parse_args()
+
+    with open(args.games, encoding="utf-8", errors="replace") as f:
+        games = [tokens for tokens, _ in read_games(f)]
+
+    start = time.perf_counter()
+    reviews = review_games(games, args.depth, args.time, args.workers)
+    elapsed = time.perf_counter() - start
+
+    for i, review in enumerate(reviews):
+        print("Game {}".format(i+1))
+        print(format_review(review))
+        print()
+    print("{} games, {} positions in {:.1f} s ({:.1f} games/min)".format(
+        len(reviews), sum(len(r) for r in reviews), elapsed,
+        60*len(reviews)/elapsed if elapsed > 0 else 0.0))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([[r.to_dict() for r in review] for review in reviews], f, indent=1)
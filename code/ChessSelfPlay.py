@@ -0,0 +1,211 @@
+'''
+Self-play training data generator.
+
+Plays games with the ChessAI searcher across a process pool and streams
+every position into fixed-size memory-mapped .npy shards:
+
+    planes     (12, 8, 8) uint8 piece planes, white pieces first (p n b r q k)
+    position   the packed GameState.to_bytes record
+    score      search score from the side to move's point of view
+    best_move  the searched best move, see ChessEngine.encode_move
+    result     game result for the side to move: 1 win, 0 draw, -1 loss
+    ply        ply number within the game
+
+index.json lists the shards and how many rows of each are filled, so a
+trainer can memory-map them and draw random batches (see load_shards and
+sample_batch).
+
+    python ChessSelfPlay.py --games 1000 --out data --workers 8
+'''
+import argparse
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from ChessEngine import GameState, POSITION_SIZE, PIECE_TO_CODE, UNDO_RECORD_SIZE, encode_move
+import ChessAI
+
+RECORD_DTYPE = np.dtype([
+    ('planes', np.uint8, (12, 8, 8)),
+    ('position', np.uint8, (POSITION_SIZE,)),
+    ('score', np.float32),
+    ('best_move', np.uint16),
+    ('result', np.int8),
+    ('ply', np.uint16),
+])
+INDEX_NAME = "index.json"
+MAX_PLIES = 300
+
+_worker_searcher = None
+
+
+def board_planes(board, out):
+    out[:] = 0
+    for r in range(8):
+        row = board[r]
+        for c in range(8):
+            code = PIECE_TO_CODE[row[c]]
+            if code:
+                out[code-1, r, c] = 1
+
+
+def is_repetition(gs: GameState):
+    # the hash of every earlier position is word 1 of its undo record
+    return gs.undo_stack[1::UNDO_RECORD_SIZE].count(gs.hash) >= 2
+
+
+def play_game(args):
+    seed, depth, time_limit, random_plies = args
+    global _worker_searcher
+    if _worker_searcher is None:
+        _worker_searcher = ChessAI.Searcher()
+    searcher = _worker_searcher
+    rng = random.Random(seed)
+
+    gs = GameState()
+    records = np.zeros(MAX_PLIES, dtype=RECORD_DTYPE)
+    sides = np.zeros(MAX_PLIES, dtype=np.int8)
+    n = 0
+    result = 0
+    valid_moves = gs.get_valid_moves()
+    while len(gs.move_log) < MAX_PLIES:
+        if gs.checkmate:
+            result = -1 if gs.white_to_move else 1
+            break
+        if gs.stalemate or gs.halfmove_clock >= 100 or is_repetition(gs):
+            break
+
+        if len(gs.move_log) < random_plies:
+            move = valid_moves[rng.randint(0, len(valid_moves)-1)]
+        else:
+            search = searcher.search(gs, valid_moves, depth, time_limit)
+            move = search.move
+            record = records[n]
+            board_planes(gs.board, record['planes'])
+            gs.pack_into(record['position'])
+            record['score'] = search.score
+            record['best_move'] = encode_move(move)
+            record['ply'] = len(gs.move_log)
+            sides[n] = 1 if gs.white_to_move else -1
+            n += 1
+
+        gs.make_move(move)
+        valid_moves = gs.get_valid_moves()
+
+    records = records[:n]
+    records['result'] = sides[:n] * result
+    return records
+
+
+class ShardWriter():
+    def __init__(self, out_dir, shard_size) -> None:
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.shards = []
+        self.current = None
+        self.filled = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def open_shard(self):
+        name = "shard_{:05d}.npy".format(len(self.shards))
+        self.current = open_memmap(os.path.join(self.out_dir, name), mode='w+',
+                                   dtype=RECORD_DTYPE, shape=(self.shard_size,))
+        self.shards.append({"file": name, "count": 0})
+        self.filled = 0
+
+    def close_shard(self):
+        if self.current is not None:
+            self.current.flush()
+            self.shards[-1]["count"] = self.filled
+            self.current = None
+            self.write_index()
+
+    def write(self, records):
+        start = 0
+        while start < len(records):
+            if self.current is None:
+                self.open_shard()
+            count = min(len(records) - start, self.shard_size - self.filled)
+            self.current[self.filled:self.filled+count] = records[start:start+count]
+            self.filled += count
+            start += count
+            if self.filled == self.shard_size:
+                self.close_shard()
+
+    def write_index(self):
+        index = {
+            "dtype": RECORD_DTYPE.descr,
+            "shard_size": self.shard_size,
+            "positions": sum(s["count"] for s in self.shards),
+            "shards": self.shards,
+        }
+        path = os.path.join(self.out_dir, INDEX_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.close_shard()
+        self.write_index()
+
+
+def load_shards(out_dir):
+    with open(os.path.join(out_dir, INDEX_NAME)) as f:
+        index = json.load(f)
+    return [np.load(os.path.join(out_dir, s["file"]), mmap_mode='r')[:s["count"]]
+            for s in index["shards"] if s["count"] > 0]
+
+
+def sample_batch(shards, batch_size, rng: np.random.Generator):
+    # only the sampled rows are read from disk
+    sizes = np.array([len(s) for s in shards], dtype=np.int64)
+    picks = rng.choice(sizes.sum(), size=batch_size, replace=False)
+    picks.sort()
+    bounds = np.cumsum(sizes)
+    shard_ids = np.searchsorted(bounds, picks, side='right')
+    batch = np.empty(batch_size, dtype=RECORD_DTYPE)
+    for i, (s, p) in enumerate(zip(shard_ids, picks)):
+        batch[i] = shards[s][p - (bounds[s] - sizes[s])]
+    return batch
+
+
+def generate(out_dir, games, workers=None, shard_size=1 << 16, depth=3, time_limit=None,
+             random_plies=6, seed=0, report=None):
+    writer = ShardWriter(out_dir, shard_size)
+    tasks = ((seed + i, depth, time_limit, random_plies) for i in range(games))
+    positions = 0
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        for done, records in enumerate(pool.imap_unordered(play_game, tasks), 1):
+            writer.write(records)
+            positions += len(records)
+            if report is not None:
+                report(done, positions, time.perf_counter() - start)
+    writer.close()
+    return positions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="generate self-play training data")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--out", default="selfplay")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: cpu count)")
+    parser.add_argument("--shard-size", type=int, default=1 << 16, help="positions per shard")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--time", type=float, default=None, help="search time per move in seconds")
+    parser.add_argument("--random-plies", type=int, default=6, help="random opening moves per game")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def report(done, positions, elapsed):
+        print("\r{}/{} games  {} positions  {:.1f} pos/s".format(
+            done, args.games, positions, positions/elapsed if elapsed > 0 else 0.0), end="", flush=True)
+
+    generate(args.out, args.games, args.workers, args.shard_size, args.depth, args.time,
+             args.random_plies, args.seed, report)
+    print()
@@ -0,0 +1,299 @@
+'''
+Headless multi-game engine server.
+
+Clients speak JSON lines over TCP or a Unix socket. Every request is an
+object with a "cmd" and an optional "id" that is echoed back on each reply:
+
+    {"id": 1, "cmd": "new"}
+    {"id": 2, "cmd": "move", "session": "s1", "move": "e2e4"}
+    {"id": 3, "cmd": "search", "session": "s1", "time": 1.0, "depth": 6, "play": true}
+    {"id": 4, "cmd": "search", "session": "s1", "time": 2.0, "multipv": 3}
+
+Searches run in a bounded process pool. While a search deepens the server
+streams {"event": "info", ...} lines, then sends the final reply. When more
+than max_pending searches are queued the request is refused with
+"error": "busy" so clients can back off. A session belongs to the
+connection that created it and is dropped when that connection closes.
+
+    python ChessServer.py --port 8765 --workers 4
+    python ChessServer.py --unix /tmp/chess.sock
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ChessEngine import GameState
+import ChessAI
+
+MAX_SESSIONS = 10000
+MAX_SEARCH_TIME = 30.0
+MAX_SEARCH_DEPTH = 20
+MAX_MULTIPV = 10
+
+_worker_searcher = None
+
+
+def search_position(position, depth, time_limit, multipv=1, previous=()):
+    # runs inside a pool worker; the searcher (and its transposition table)
+    # lives for the whole worker process so consecutive depths and
+    # positions from the same game reuse its entries
+    global _worker_searcher
+    if _worker_searcher is None:
+        _worker_searcher = ChessAI.Searcher()
+    gs = GameState.from_bytes(position)
+    valid_moves = gs.get_valid_moves()
+    searcher = _worker_searcher
+    searcher.nodes = 0
+    searcher.deadline = None
+    # previous holds the root moves of the last depth's lines, best first
+    by_notation = {m.get_chess_notation(): m for m in valid_moves}
+    previous_lines = [(by_notation[n], 0) for n in previous if n in by_notation]
+    try:
+        if time_limit is not None:
+            searcher.deadline = time.perf_counter() + time_limit
+        lines = searcher.searchRootMultiPV(gs, valid_moves, depth, multipv, previous_lines)
+    except ChessAI.SearchTimeout:
+        return {"complete": False, "depth": depth, "nodes": searcher.nodes}
+    finally:
+        searcher.deadline = None
+    pvs = [{
+        "move": move.get_chess_notation(),
+        "score": score,
+        "pv": [m.get_chess_notation() for m in searcher.principalVariation(gs, move, depth)],
+    } for move, score in lines]
+    return {"complete": True, "depth": depth, "nodes": searcher.nodes, **pvs[0], "lines": pvs}
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class RequestError(Exception):
+    pass
+
+
+class Session():
+    def __init__(self, session_id) -> None:
+        self.session_id = session_id
+        self.gs = GameState()
+        self.valid_moves = self.gs.get_valid_moves()
+
+    def refresh(self):
+        self.valid_moves = self.gs.get_valid_moves()
+
+    def find_move(self, notation):
+        for m in self.valid_moves:
+            if m.get_chess_notation() == notation:
+                return m
+        raise RequestError("illegal move {}".format(notation))
+
+    def status(self):
+        gs = self.gs
+        return {
+            "session": self.session_id,
+            "position": gs.to_bytes().hex(),
+            "white_to_move": gs.white_to_move,
+            "checkmate": gs.checkmate,
+            "stalemate": gs.stalemate,
+            "moves": [m.get_chess_notation() for m in gs.move_log],
+        }
+
+
+class EngineServer():
+    def __init__(self, workers=None, max_pending=None, max_sessions=MAX_SESSIONS) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending if max_pending is not None else 4*self.workers
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.pending = 0
+        self.pool = None
+        self.slots = None
+        self.commands = {
+            "new": self.cmd_new,
+            "close": self.cmd_close,
+            "state": self.cmd_state,
+            "moves": self.cmd_moves,
+            "move": self.cmd_move,
+            "undo": self.cmd_undo,
+            "search": self.cmd_search,
+            "stats": self.cmd_stats,
+        }
+
+    def start_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.slots = asyncio.Semaphore(self.workers)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def get_session(self, request) -> Session:
+        session = self.sessions.get(request.get("session"))
+        if session is None:
+            raise RequestError("unknown session")
+        return session
+
+    async def cmd_new(self, request, send):
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("too many sessions")
+        session_id = "s{}".format(next(self.session_ids))
+        session = Session(session_id)
+        self.sessions[session_id] = session
+        return session.status()
+
+    async def cmd_close(self, request, send):
+        session = self.get_session(request)
+        del self.sessions[session.session_id]
+        return {"session": session.session_id}
+
+    async def cmd_state(self, request, send):
+        return self.get_session(request).status()
+
+    async def cmd_moves(self, request, send):
+        session = self.get_session(request)
+        return {"moves": [m.get_chess_notation() for m in session.valid_moves]}
+
+    async def cmd_move(self, request, send):
+        session = self.get_session(request)
+        session.gs.make_move(session.find_move(request.get("move")))
+        session.refresh()
+        return session.status()
+
+    async def cmd_undo(self, request, send):
+        session = self.get_session(request)
+        session.gs.undo_move()
+        session.refresh()
+        return session.status()
+
+    async def cmd_stats(self, request, send):
+        return {"sessions": len(self.sessions), "pending": self.pending, "workers": self.workers}
+
+    async def cmd_search(self, request, send):
+        session = self.get_session(request)
+        if session.gs.checkmate or session.gs.stalemate:
+            raise RequestError("game is over")
+        if self.pending >= self.max_pending:
+            raise ServerBusy()
+
+        max_depth = max(1, min(int(request.get("depth", MAX_SEARCH_DEPTH)), MAX_SEARCH_DEPTH))
+        time_limit = min(float(request.get("time", 1.0)), MAX_SEARCH_TIME)
+        multipv = max(1, min(int(request.get("multipv", 1)), MAX_MULTIPV))
+        position = session.gs.to_bytes()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + time_limit
+        best = None
+
+        self.pending += 1
+        try:
+            for depth in range(1, max_depth+1):
+                async with self.slots:
+                    remaining = deadline - loop.time()
+                    # depth 1 always completes so there is a move to return
+                    if remaining <= 0 and best is not None:
+                        break
+                    previous = [line["move"] for line in best["lines"]] if best is not None else ()
+                    result = await loop.run_in_executor(
+                        self.pool, search_position, position, depth,
+                        remaining if best is not None else None, multipv, previous)
+                if not result["complete"]:
+                    break
+                best = result
+                await send({"event": "info", **result})
+                if all(abs(line["score"]) > ChessAI.MATE_THRESHOLD for line in result["lines"]):
+                    break
+        finally:
+            self.pending -= 1
+
+        reply = {"move": best["move"], "score": best["score"], "depth": best["depth"], "pv": best["pv"]}
+        if multipv > 1:
+            reply["lines"] = best["lines"]
+        # only play the move if nobody changed the game while we searched
+        if request.get("play") and session.gs.to_bytes() == position:
+            session.gs.make_move(session.find_move(best["move"]))
+            session.refresh()
+            reply.update(session.status())
+        return reply
+
+    async def handle_request(self, request, send):
+        command = self.commands.get(request.get("cmd"))
+        if command is None:
+            raise RequestError("unknown command {}".format(request.get("cmd")))
+        return await command(request, send)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def send_line(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+        # sessions created on this connection and not closed yet
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    await send_line({"ok": False, "error": "invalid json"})
+                    continue
+                if not isinstance(request, dict):
+                    await send_line({"ok": False, "error": "request must be a json object"})
+                    continue
+                request_id = request.get("id")
+
+                async def send(message):
+                    await send_line({"id": request_id, **message})
+
+                try:
+                    reply = await self.handle_request(request, send)
+                    if request.get("cmd") == "new":
+                        owned.add(reply["session"])
+                    elif request.get("cmd") == "close":
+                        owned.discard(reply["session"])
+                    await send({"ok": True, **reply})
+                except ServerBusy:
+                    await send({"ok": False, "error": "busy"})
+                except (RequestError, ValueError, TypeError) as e:
+                    await send({"ok": False, "error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None):
+        self.start_pool()
+        try:
+            if unix_path is not None:
+                server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+            else:
+                server = await asyncio.start_server(self.handle_client, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="multi-game chess engine server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="search processes (default: cpu count)")
+    parser.add_argument("--max-pending", type=int, default=None, help="queued searches before replying busy")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    args = parser.parse_args()
+
+    server = EngineServer(args.workers, args.max_pending, args.max_sessions)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass